@@ -0,0 +1,145 @@
+"""Regression checks of the loaded tables and the snapshot history on synthetic workbooks.
+
+Usage: python benchmarks/check_consistency.py [--files 4] [--cost-lines 60] [--invoice-rows 20]
+
+Loads synthetic workbooks into a throw-away SQLite database and checks:
+queries.actuals_by_parent_cost_code matches hierarchy.rollup of the same lines,
+a cached query sees a load committed by another process, snapshot compaction
+never reuses a version number and rejects a version past the newest one, and a
+compacted history still rebuilds the loaded budget.
+Exits with status 1 if a check fails.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# No on-disk frame or layout caches, so every run extracts the workbooks it generated
+os.environ["ITAM_FRAME_CACHE_DIR"] = ""
+os.environ["ITAM_LAYOUT_CACHE_DIR"] = ""
+
+import pandas as pd  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from budget_storage import BUDGET_TABLE  # noqa: E402
+from hierarchy import rollup  # noqa: E402
+from loader import get_engine  # noqa: E402
+from normalize import ACTUAL_CODE_SUFFIX, strip_actual_codes  # noqa: E402
+from pipeline import run_pipeline  # noqa: E402
+from queries import actuals_by_parent_cost_code, budget_by_asset_quarter  # noqa: E402
+from snapshots import VERSIONS_TABLE, budget_as_of, compact_snapshots, take_snapshot  # noqa: E402
+from synthetic_workbooks import generate_workbooks  # noqa: E402
+
+
+def check_rollup(db_url, tolerance=0.01):
+    """actuals_by_parent_cost_code agrees with hierarchy.rollup of the same '-A' lines for every year."""
+    failures = []
+    with get_engine(db_url).connect() as conn:
+        budget = pd.read_sql(text(f'SELECT "Year", "Asset", "Cost Code", "Érték" FROM {BUDGET_TABLE} '
+                                  f'WHERE "Cost Code" LIKE \'%{ACTUAL_CODE_SUFFIX}\''), conn)
+    for year, year_df in budget.groupby("Year"):
+        expected = rollup(year_df.drop(columns="Year"), group_columns=("Asset",))
+        expected = expected.rename(columns={"Érték": "Expected"})
+        expected["Cost Code"] = strip_actual_codes(expected["Cost Code"])
+        compared = actuals_by_parent_cost_code(year, db_url=db_url).merge(
+            expected, on=["Asset", "Cost Code"], how="outer")
+        differs = ~((compared["Actual"].fillna(0) - compared["Expected"].fillna(0)).abs() <= tolerance)
+        if differs.any():
+            failures.append(f"{year}: {int(differs.sum())} rolled-up actual(s) differ from hierarchy.rollup")
+    return failures
+
+
+# Reloads one asset's budget rows in a separate process, as a pipeline run started elsewhere would
+_RELOAD_SCRIPT = """
+import sys
+import pandas as pd
+from sqlalchemy import text
+from budget_storage import BUDGET_TABLE, BudgetLoad
+from loader import get_engine
+db_url, asset = sys.argv[1:]
+with get_engine(db_url).begin() as conn:
+    df = pd.read_sql(text(f'SELECT * FROM {BUDGET_TABLE} WHERE "Asset" = :asset'), conn, params={"asset": asset})
+    load = BudgetLoad(conn, assets=[asset])
+    load.append(df.assign(**{"Hónap": pd.to_datetime(df["Hónap"]), "Érték": df["Érték"] + 1}))
+    load.finish()
+"""
+
+
+def check_query_cache(db_url):
+    """A cached result is not served after another process reloaded its asset."""
+    year, asset = pd.read_sql(text(f'SELECT MIN("Year"), MIN("Asset") FROM {BUDGET_TABLE}'),
+                              get_engine(db_url)).iloc[0]
+    before = budget_by_asset_quarter(year, [asset], db_url=db_url)
+    subprocess.run([sys.executable, "-c", _RELOAD_SCRIPT, db_url, asset], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    after = budget_by_asset_quarter(year, [asset], db_url=db_url)
+    if after.equals(before):
+        return [f"budget_by_asset_quarter({year}, [{asset!r}]) served a result from before another process's load"]
+    return []
+
+
+def check_snapshots(db_url):
+    """Compaction past the newest version is rejected, version numbers are never reused, and as-of stays exact."""
+    failures = []
+    engine = get_engine(db_url)
+    with engine.begin() as conn:
+        conn.execute(text(f'UPDATE {BUDGET_TABLE} SET "Érték" = "Érték" + 1 WHERE "Cost Code" = '
+                          f'(SELECT MIN("Cost Code") FROM {BUDGET_TABLE})'))
+        changed_version, _ = take_snapshot(conn)
+
+    with engine.begin() as conn:
+        try:
+            compact_snapshots(conn, changed_version + 10)
+            failures.append("compact_snapshots accepted a version past the newest one")
+        except ValueError:
+            pass
+
+    # Even with the version rows gone, the next number comes after every stored delta
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM {VERSIONS_TABLE}"))
+        version, _ = take_snapshot(conn)
+    if version <= changed_version:
+        failures.append(f"snapshot version {version} reused after version {changed_version}")
+
+    with engine.begin() as conn:
+        compact_snapshots(conn, version)
+        budget = pd.read_sql(text(f'SELECT "Asset", "Cost Code", "Hónap", "Érték" FROM {BUDGET_TABLE}'), conn)
+    as_of = budget_as_of(version, db_url=db_url)
+    keys = ["Asset", "Cost Code", "Hónap"]
+    budget = budget.assign(Hónap=pd.to_datetime(budget["Hónap"])).groupby(keys)["Érték"].sum(min_count=1)
+    as_of = as_of.assign(Hónap=pd.to_datetime(as_of["Hónap"])).set_index(keys)["Érték"]
+    if not budget.sort_index().round(6).equals(as_of.sort_index().round(6)):
+        failures.append(f"budget_as_of({version}) after compaction differs from the {BUDGET_TABLE} table")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--cost-lines", type=int, default=60)
+    parser.add_argument("--invoice-rows", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate_workbooks(tmp, files=args.files, cost_lines=args.cost_lines, invoice_rows=args.invoice_rows)
+        db_url = f"sqlite:///{os.path.join(tmp, 'check.db')}"
+        run_pipeline(tmp, db_url, workers=1, snapshot=True)
+
+        failures = []
+        for name, check in (("rollup", check_rollup), ("query_cache", check_query_cache),
+                            ("snapshots", check_snapshots)):
+            check_failures = check(db_url)
+            print(f"{name:<12} {'FAILED' if check_failures else 'ok'}")
+            failures += check_failures
+        get_engine(db_url).dispose()
+
+    for failure in failures:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import pandas as pd
+import sqlalchemy.types as types
+from sqlalchemy import bindparam, inspect, text
+
+from loader import append_frame, delete_asset_rows, notify_replaced
+
+# Long-format budget lines of every year, partitioned by "Year" on PostgreSQL
+BUDGET_TABLE = "budget"
+
+BUDGET_COLUMN_TYPES = {
+    "Cost Code": types.VARCHAR(50),
+    "Cost Name": types.VARCHAR(255),
+    "Asset": types.VARCHAR(255),
+    "Hónap": types.DATE,  # Hónap oszlop DATE adattípusként tárolva
+    "Érték": types.FLOAT,  # Az érték oszlop numerikus formátum
+    "Quarter": types.VARCHAR(10),
+    "Year": types.INTEGER,
+}
+
+_COLUMNS_SQL = """
+    "Cost Code" VARCHAR(50),
+    "Cost Name" VARCHAR(255),
+    "Asset" VARCHAR(255),
+    "Hónap" DATE,
+    "Érték" FLOAT,
+    "Quarter" VARCHAR(10),
+    "Year" INTEGER NOT NULL
+"""
+
+
+def partition_name(year):
+    return f"{BUDGET_TABLE}_{year}"
+
+
+def year_view_name(year):
+    """Per-year view kept for dashboards that still read combined_budget_<year>."""
+    return f"combined_budget_{year}"
+
+
+def ensure_budget_table(conn):
+    """Create the budget table (partitioned by Year on PostgreSQL) and its Asset index."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f'CREATE TABLE IF NOT EXISTS {BUDGET_TABLE} ({_COLUMNS_SQL}) PARTITION BY LIST ("Year")'))
+        # Partitioned index: every year partition gets its own Asset index
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {BUDGET_TABLE}_asset_idx ON {BUDGET_TABLE} ("Asset")'))
+    else:
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {BUDGET_TABLE} ({_COLUMNS_SQL})"))
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {BUDGET_TABLE}_year_asset_idx ON {BUDGET_TABLE} ("Year", "Asset")'
+        ))
+
+
+def ensure_year_view(conn, year):
+    """Expose one year as combined_budget_<year>, replacing the old stand-alone table if present."""
+    view = year_view_name(year)
+    if view in inspect(conn).get_table_names():
+        conn.execute(text(f'DROP TABLE "{view}"'))
+    columns = ", ".join(f'"{col}"' for col in BUDGET_COLUMN_TYPES if col != "Year")
+    create = "CREATE OR REPLACE VIEW" if conn.dialect.name == "postgresql" else "CREATE VIEW IF NOT EXISTS"
+    conn.execute(text(f'{create} "{view}" AS SELECT {columns} FROM {BUDGET_TABLE} WHERE "Year" = {int(year)}'))
+
+
+def _staging_name(year):
+    return f"{partition_name(year)}__staging"
+
+
+def _create_staging(conn, year):
+    """Fresh staging table for one year's rows; on PostgreSQL it is shaped to become the year's partition."""
+    staging = _staging_name(year)
+    conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(f"CREATE TABLE {staging} (LIKE {BUDGET_TABLE} INCLUDING DEFAULTS)"))
+        # The CHECK constraint lets ATTACH PARTITION skip its validation scan
+        conn.execute(text(f'ALTER TABLE {staging} ADD CONSTRAINT {staging}_year CHECK ("Year" = {int(year)})'))
+    else:
+        conn.execute(text(f"CREATE TABLE {staging} ({_COLUMNS_SQL})"))
+
+
+def _swap_partition(conn, year):
+    """Swap the year's staging table in for its old partition."""
+    partition, staging = partition_name(year), _staging_name(year)
+    if inspect(conn).has_table(partition):
+        conn.execute(text(f"ALTER TABLE {BUDGET_TABLE} DETACH PARTITION {partition}"))
+        conn.execute(text(f"DROP TABLE {partition}"))
+    conn.execute(text(f"ALTER TABLE {staging} RENAME TO {partition}"))
+    conn.execute(text(f"ALTER TABLE {BUDGET_TABLE} ATTACH PARTITION {partition} FOR VALUES IN ({int(year)})"))
+
+
+def _merge_staging(conn, year, assets):
+    """Replace the year's rows (or only the given assets' rows within it) with the staged rows."""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(year)} "
+            f"PARTITION OF {BUDGET_TABLE} FOR VALUES IN ({int(year)})"
+        ))
+    # The Year filter lets PostgreSQL prune the delete to this year's partition
+    if assets is None:
+        conn.execute(text(f'DELETE FROM {BUDGET_TABLE} WHERE "Year" = :year'), {"year": int(year)})
+    else:
+        conn.execute(
+            text(f'DELETE FROM {BUDGET_TABLE} WHERE "Year" = :year AND "Asset" IN :assets')
+            .bindparams(bindparam("assets", expanding=True)),
+            {"year": int(year), "assets": sorted({a for a in assets if pd.notna(a)}) or [None]}
+        )
+    columns = ", ".join(f'"{col}"' for col in BUDGET_COLUMN_TYPES)
+    conn.execute(text(f"INSERT INTO {BUDGET_TABLE} ({columns}) SELECT {columns} FROM {_staging_name(year)}"))
+    conn.execute(text(f"DROP TABLE {_staging_name(year)}"))
+
+
+class BudgetLoad:
+    """Streams long-format budget frames of any years into per-year staging tables.
+
+    Works like loader.StagedLoad: create it inside ``engine.begin()``, append
+    one frame per workbook and call ``finish``. Rows are assigned to years by
+    their "Hónap" unless the frame has a "Year" column. With ``assets=None``
+    every year that received rows is replaced (on PostgreSQL by swapping in a
+    new partition); otherwise only those assets' rows within those years are.
+    Other years are never touched, except by ``removed_assets``: (asset, year)
+    pairs whose rows are deleted first, year None meaning every year (for
+    emptied or deleted workbooks).
+    """
+
+    def __init__(self, conn, assets=None, removed_assets=()):
+        self.conn = conn
+        self.assets = assets
+        self.removed_assets = removed_assets
+        self.years = {}
+        ensure_budget_table(conn)
+
+    def append(self, df):
+        if "Year" not in df.columns:
+            df = df.assign(Year=df["Hónap"].dt.year)
+        df = df[list(BUDGET_COLUMN_TYPES)]
+        if isinstance(df["Hónap"].dtype, pd.PeriodDtype):
+            df = df.assign(Hónap=df["Hónap"].dt.to_timestamp())
+        for year, year_df in df.groupby("Year", observed=True):
+            year = int(year)
+            if year not in self.years:
+                _create_staging(self.conn, year)
+                self.years[year] = 0
+            append_frame(self.conn, year_df, _staging_name(year))
+            self.years[year] += len(year_df)
+
+    def finish(self):
+        """Publish every staged year. Returns the number of rows loaded."""
+        removed = {a for a, _ in self.removed_assets if pd.notna(a)}
+        for asset, year in self.removed_assets:
+            if pd.isna(asset):
+                continue
+            if year is None:
+                delete_asset_rows(self.conn, BUDGET_TABLE, [asset])
+            else:
+                delete_asset_rows(self.conn, BUDGET_TABLE, [asset], ' AND "Year" = :year', {"year": int(year)})
+        for year in sorted(self.years):
+            if self.assets is None and self.conn.dialect.name == "postgresql":
+                _swap_partition(self.conn, year)
+            else:
+                _merge_staging(self.conn, year, self.assets)
+            ensure_year_view(self.conn, year)
+        if self.years:
+            notify_replaced(BUDGET_TABLE, None if self.assets is None
+                            else {a for a in self.assets if pd.notna(a)} | removed, self.conn)
+        elif removed:
+            notify_replaced(BUDGET_TABLE, removed, self.conn)
+        return sum(self.years.values())
+
+
+def load_budget_year(conn, df, year, assets=None):
+    """Write one year of long-format budget lines.
+
+    With ``assets=None`` the whole year is replaced (on PostgreSQL by swapping
+    in a new partition); otherwise only those assets' rows within the year are
+    replaced. Other years are never touched. Run it inside ``engine.begin()``.
+    """
+    load = BudgetLoad(conn, assets=assets)
+    load.append(df.assign(Year=int(year)))
+    return load.finish()
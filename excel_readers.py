@@ -0,0 +1,105 @@
+import datetime
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+
+# Reader backend used when none is passed explicitly ("openpyxl" or "calamine")
+EXCEL_READER = os.environ.get("ITAM_EXCEL_READER", "openpyxl")
+
+
+def _convert_cell(value):
+    """Match the cell conversions pandas applies in read_excel."""
+    if value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime.combine(value, datetime.time())
+    return value
+
+
+def _to_frame(rows, min_row, min_col, max_col):
+    """Build a header-less DataFrame whose index is the 0-based sheet row."""
+    width = None if max_col is None else max_col - min_col + 1
+    rows = [[_convert_cell(v) for v in row] for row in rows]
+    frame = pd.DataFrame(rows, columns=range(width) if width is not None else None)
+    if width is None:
+        frame.columns = range(frame.shape[1])
+    frame.index = range(min_row - 1, min_row - 1 + len(frame))
+    return frame
+
+
+class OpenpyxlReader:
+    """Streams only the requested cells using openpyxl's read-only mode."""
+
+    name = "openpyxl"
+
+    def open(self, file_path):
+        return load_workbook(file_path, read_only=True, data_only=True)
+
+    def close(self, workbook):
+        workbook.close()
+
+    def sheet_names(self, workbook):
+        return workbook.sheetnames
+
+    def read_range(self, workbook, tab_name, min_row=1, max_row=None, min_col=1, max_col=None):
+        """Read a 1-based, inclusive cell range. Open-ended bounds run to the sheet edge."""
+        ws = workbook[tab_name]
+        rows = ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col, values_only=True)
+        return _to_frame(rows, min_row, min_col, max_col)
+
+
+class CalamineReader:
+    """Native (Rust) reader; parses each sheet once per open workbook and slices out the requested ranges."""
+
+    name = "calamine"
+
+    def open(self, file_path):
+        try:
+            from python_calamine import CalamineWorkbook
+        except ImportError as e:
+            raise ImportError("The 'calamine' reader requires the python-calamine package.") from e
+        # The workbook and its parsed sheets ({tab name: rows}); calamine can only parse a whole sheet
+        return {"workbook": CalamineWorkbook.from_path(file_path), "sheets": {}}
+
+    def close(self, workbook):
+        workbook["sheets"].clear()
+        workbook["workbook"].close()
+
+    def sheet_names(self, workbook):
+        return workbook["workbook"].sheet_names
+
+    def _rows(self, workbook, tab_name):
+        sheets = workbook["sheets"]
+        if tab_name not in sheets:
+            sheets[tab_name] = workbook["workbook"].get_sheet_by_name(tab_name).to_python(skip_empty_area=False)
+        return sheets[tab_name]
+
+    def read_range(self, workbook, tab_name, min_row=1, max_row=None, min_col=1, max_col=None):
+        """Read a 1-based, inclusive cell range. Open-ended bounds run to the sheet edge."""
+        rows = self._rows(workbook, tab_name)[min_row - 1:max_row]
+        rows = [row[min_col - 1:max_col] for row in rows]
+        return _to_frame(rows, min_row, min_col, max_col)
+
+
+READERS = {
+    OpenpyxlReader.name: OpenpyxlReader,
+    CalamineReader.name: CalamineReader,
+}
+
+
+def get_reader(name=None):
+    """Return a reader instance for the given backend name (defaults to EXCEL_READER)."""
+    name = name or EXCEL_READER
+    if name not in READERS:
+        raise ValueError(f"Unknown Excel reader '{name}'. Choose one of: {', '.join(READERS)}")
+    return READERS[name]()
+
+
+def parse_cell_ref(cell_ref):
+    """Convert an A1-style reference to 1-based (row, col)."""
+    col_letters, row = coordinate_from_string(cell_ref)
+    return row, column_index_from_string(col_letters)
@@ -1,169 +1,305 @@
-from sqlalchemy import create_engine
+import re
+
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 import sqlalchemy.types as types
 import openpyxl
+from instrumentation import instrumented
+from loader import get_engine, load_table
+from normalize import (ACTUAL_CODE_SUFFIX, ACTUAL_NAME_SUFFIX, clean_cost_codes, fallback_cost_names,
+                       mark_actual_codes, to_dates, to_float, to_text)
+from workbook_cache import workbook_cache
+
+# Bump whenever the extraction logic changes, so cached frames from older versions are not reused
+EXTRACTOR_VERSION = 8
+
+BUDGET_TAB = "{year} Budget vs Actual"
+# Cost lines start on row 22 of the budget tab: code in A, fallback name in B, name in C, months in D:O.
+# Workbooks laid out differently are handled through their sniffed layout (see registry.py).
+BUDGET_START_ROW = 22
+ASSET_CELL = "D4"
+INVOICE_TAB = "{year} Invoice Approvals"
+
+
+def detect_budget_year(file_path, cache=workbook_cache):
+    """Return the year of the workbook's '<year> Budget vs Actual' sheet."""
+    for sheet_name in cache.sheet_names(file_path):
+        match = re.fullmatch(r"(\d{4}) Budget vs Actual", sheet_name.strip())
+        if match:
+            return int(match.group(1))
+    raise ValueError(f"No '<year> Budget vs Actual' sheet found in {file_path}")
+
+
+# Quarter label of each month, indexed by month number - 1
+QUARTER_CATEGORIES = ["Q1", "Q2", "Q3", "Q4"]
+QUARTER_OF_MONTH = np.repeat(np.arange(4, dtype="int8"), 3)
+
+LONG_CATEGORICAL_COLUMNS = ["Cost Code", "Cost Name", "Asset", "Quarter"]
+
+INVOICE_TABLE = "invoice_approvals"
+
+# Typed invoice_approvals schema: text columns with their maximum length, dates and Euro amounts
+INVOICE_TEXT_COLUMNS = {
+    "Jira Number (Purchase Order)": 1000,
+    "Vendor (Contractor)": 1000,
+    "Description": 1000,
+    "Budget Line": 1000,
+}
+INVOICE_DATE_COLUMNS = ["Due Date", "Country Office Approval (Date)", "HQ Approval (Date)", "Invoice Payment Date"]
+INVOICE_AMOUNT_COLUMNS = ["Invoice Net Amount (Euro)", "Invoice Gross Amount (Euro)"]
+# The invoice columns in the order they are loaded
+INVOICE_REQUIRED_COLUMNS = [
+    "Jira Number (Purchase Order)", "Vendor (Contractor)", "Description", "Budget Line", "Due Date",
+    "Invoice Net Amount (Euro)", "Invoice Gross Amount (Euro)", "Country Office Approval (Date)",
+    "HQ Approval (Date)", "Invoice Payment Date",
+]
+
+INVOICE_COLUMN_TYPES = {
+    **{col: types.VARCHAR(length) for col, length in INVOICE_TEXT_COLUMNS.items()},
+    **{col: types.DATE for col in INVOICE_DATE_COLUMNS},
+    **{col: types.NUMERIC(14, 2) for col in INVOICE_AMOUNT_COLUMNS},
+    "Asset": types.VARCHAR(255),
+}
+# Indexes of the filters and groupings the dashboards use
+INVOICE_INDEXES = [("Asset",), ("Budget Line",), ("Due Date",)]
+
+
+def month_columns(year):
+    """Month column names of a budget year, e.g. '2024-01' ... '2024-12'."""
+    return pd.date_range(start=f"{year}-01", periods=12, freq="MS").strftime("%Y-%m").tolist()
+
+
+def concat_long_frames(frames):
+    """Concatenate long-format budget frames, keeping the categorical columns categorical.
+
+    A plain pd.concat falls back to object dtype when the categories differ
+    between workbooks, so the categories are unioned first.
+    """
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return None
+    columns = {}
+    for col in frames[0].columns:
+        if col in LONG_CATEGORICAL_COLUMNS:
+            columns[col] = pd.Series(union_categoricals([df[col] for df in frames]), copy=False)
+        else:
+            columns[col] = pd.concat([df[col] for df in frames], ignore_index=True)
+    return pd.DataFrame(columns)
+
 
 class StandardBudgetProcessor:
-    def __init__(self, file_path, db_url):
+    """Budget lines of one workbook.
+
+    ``layout`` is the workbook's sniffed layout (see registry.workbook_layout);
+    without it the standard layout is assumed: asset name in D4, cost lines from
+    row 22 of the '<year> Budget vs Actual' sheet.
+    """
+
+    def __init__(self, file_path, db_url, cache=None, year=None, layout=None):
         self.file_path = file_path
         self.db_url = db_url
+        self.cache = cache if cache is not None else workbook_cache
+        self.layout = layout
+        self.year = year if year is not None or layout is None else layout["year"]
         self.data = None
-
-    def extract_asset_name(self, cell_ref="D4", tab_name="2024 Budget vs Actual"):
-        """Extract the asset name from a specific cell."""
-        xl = pd.ExcelFile(self.file_path)
-        sheet = xl.parse(tab_name, header=None)
-        col, row = self._convert_cell_ref(cell_ref)
-        return sheet.iloc[row, col]  # Extract asset name based on cell_ref
-
-    def extract_monthly_data(self, tab_name="2024 Budget vs Actual"):
+        self.bad_cells = None
+
+    def budget_tab(self, tab_name=None):
+        """Resolve the budget tab name and the budget year from each other or from the workbook."""
+        if tab_name is None and self.layout is not None:
+            tab_name = self.layout["budget_tab"]
+        if tab_name is not None and self.year is None:
+            match = re.match(r"(\d{4})\b", tab_name)
+            if match:
+                self.year = int(match.group(1))
+        if self.year is None:
+            self.year = detect_budget_year(self.file_path, self.cache)
+        return tab_name if tab_name is not None else BUDGET_TAB.format(year=self.year)
+
+    @instrumented
+    def extract_asset_name(self, cell_ref=None, tab_name=None):
+        """Extract the asset name from a specific cell (by default the layout's asset cell)."""
+        if cell_ref is None:
+            cell_ref = self.layout["asset_cell"] if self.layout is not None else ASSET_CELL
+        return self.cache.get_cell(self.file_path, self.budget_tab(tab_name), cell_ref)
+
+    def budget_block(self, tab_name=None):
+        """Columns A:O of the budget tab from the first cost line down (shared, do not modify)."""
+        start_row = self.layout["data_start_row"] if self.layout is not None else BUDGET_START_ROW
+        return self.cache.get_range(self.file_path, self.budget_tab(tab_name), min_row=start_row,
+                                    min_col=1, max_col=15)
+
+    @instrumented
+    def extract_monthly_data(self, tab_name=None):
         """Extract the monthly data (D:O)."""
-        xl = pd.ExcelFile(self.file_path)
-        sheet = xl.parse(tab_name, header=None)
+        tab_name = self.budget_tab(tab_name)
+        block = self.budget_block(tab_name)
 
-        start_row = 21
-        data = sheet.iloc[start_row:, 3:15]  # Columns D:O
+        data = block.iloc[:, 3:15].copy()  # Columns D:O
 
-        month_names = pd.date_range(start="2024-01", periods=12, freq="MS").strftime("%Y-%m").tolist()
-        data.columns = month_names
-        data.insert(0, "Cost Code", sheet.iloc[start_row:, 0])  # Column A (Code)
-        data.insert(1, "Cost Name", sheet.iloc[start_row:, 2])  # Column C (Name)
+        data.columns = month_columns(self.year)
+        data.insert(0, "Cost Code", block.iloc[:, 0])  # Column A (Code)
+        data.insert(1, "Cost Name", block.iloc[:, 2])  # Column C (Name)
 
-        asset_name = self.extract_asset_name()
+        asset_name = self.extract_asset_name(tab_name=tab_name)
         data["Asset"] = asset_name
 
         self.data = data.dropna(subset=["Cost Code"])
         return self.data
 
+    @instrumented
+    def extract_costcenters(self, tab_name=None):
+        """Return the cost-center rows (CostCode, CostName) of the budget lines, followed by their '-A' Actual pairs.
+
+        Reads the same range as extract_monthly_data, so the sheet is parsed only once per workbook.
+        """
+        block = self.budget_block(tab_name)
+        rows = pd.DataFrame({
+            "CostCode": block.iloc[:, 0],
+            # Column C holds the name, column B is used where C is only a number
+            "CostName": fallback_cost_names(block.iloc[:, 2], block.iloc[:, 1]),
+        }).dropna(subset=["CostCode"])
+
+        codes = clean_cost_codes(rows["CostCode"]).str[:50]
+        names = rows["CostName"].fillna("").astype(str).str[:255]
+        return pd.DataFrame({
+            "CostCode": pd.concat([codes, codes + ACTUAL_CODE_SUFFIX], ignore_index=True),
+            "CostName": pd.concat([names, names + ACTUAL_NAME_SUFFIX], ignore_index=True),
+        })
+
+    @instrumented
     def modify_cost_code(self):
         """Handle 'Actual' text and duplicates in Cost Code."""
-        self.data["Cost Code"] = self.data["Cost Code"].astype(str)
+        # '21000', not '21000.0', when a blank row turned column A into floats
+        self.data["Cost Code"] = clean_cost_codes(self.data["Cost Code"])
         self.data["Cost Name"] = self.data["Cost Name"].fillna("").astype(str)
 
-        self.data["Cost Code"] = self.data.apply(
-            lambda row: f"{row['Cost Code']}-A" if "Actual" in row["Cost Name"] else row["Cost Code"], axis=1
-        )
+        self.data["Cost Code"] = mark_actual_codes(self.data["Cost Code"], self.data["Cost Name"])
 
         duplicates = self.data.duplicated(subset=["Cost Code", "Cost Name"], keep="first")
         self.data.loc[duplicates, "Cost Code"] = self.data.loc[duplicates, "Cost Code"] + "-A"
 
+    @instrumented(rows_out="data")
+    def convert_monthly_values(self):
+        """Convert the month columns to float64 and return the cells that could not be parsed."""
+        month_columns = [col for col in self.data.columns if col not in ("Cost Code", "Cost Name", "Asset")]
+        self.data, self.bad_cells = to_float(self.data, month_columns)
+        return self.bad_cells
+
+    @instrumented
+    def to_long_format(self, value_dtype="float64"):
+        """Return the monthly data as one row per cost line and month, with compact dtypes.
+
+        Cost Code, Cost Name, Asset and Quarter are categorical, Hónap is a
+        monthly Period and Érték is ``value_dtype``. Built directly from the
+        wide value matrix, so no melt or month-string parsing is needed.
+        """
+        months = month_columns(self.year)
+        rows = len(self.data)
+
+        def repeated_categorical(values):
+            codes, categories = pd.factorize(values, use_na_sentinel=True)
+            return pd.Categorical.from_codes(np.tile(codes, 12), categories=categories)
+
+        return pd.DataFrame({
+            "Cost Code": repeated_categorical(self.data["Cost Code"]),
+            "Cost Name": repeated_categorical(self.data["Cost Name"]),
+            "Asset": repeated_categorical(self.data["Asset"]),
+            "Hónap": pd.PeriodIndex(np.repeat(pd.period_range(f"{self.year}-01", periods=12, freq="M"), rows)),
+            # Month-major order, the same as DataFrame.melt
+            "Érték": self.data[months].to_numpy(dtype=value_dtype).ravel(order="F"),
+            "Quarter": pd.Categorical.from_codes(np.repeat(QUARTER_OF_MONTH, rows), categories=QUARTER_CATEGORIES),
+        })
+
+    @instrumented
     def upload_to_sql(self, table_name):
         """Upload the extracted data to an SQL database."""
-        for col in self.data.columns:
-            if self.data[col].dtype == "object":
-                self.data[col] = self.data[col].apply(
-                    lambda x: str(x).replace(",", ".") if pd.notnull(x) else x
-                ).astype(float, errors="ignore")
+        if self.bad_cells is None:
+            self.convert_monthly_values()
 
         column_types = {
             "Cost Code": types.VARCHAR(50),
             "Cost Name": types.VARCHAR(255),
             "Asset": types.VARCHAR(255),
-            **{month: types.FLOAT for month in pd.date_range(start="2024-01", periods=12, freq="MS").strftime("%Y-%m")}
+            **{month: types.FLOAT for month in month_columns(self.year)}
         }
 
-        engine = create_engine(self.db_url)
-        with engine.connect() as conn:
-            self.data.to_sql(
-                table_name,
-                con=conn,
-                if_exists="replace",
-                index=False,
-                dtype=column_types
-            )
+        engine = get_engine(self.db_url)
+        with engine.begin() as conn:
+            load_table(conn, self.data, table_name, dtype=column_types)
         print(f"Data uploaded to table: {table_name}")
 
-    def _convert_cell_ref(self, cell_ref):
-        col = ord(cell_ref[0].upper()) - ord('A')
-        row = int(cell_ref[1:]) - 1
-        return col, row
 
-class LeMasserieBudgetProcessor(StandardBudgetProcessor):
-    def extract_monthly_data(self, tab_name="2024 Budget vs Actual"):
-        return super().extract_monthly_data(tab_name=tab_name)
-
-class EspacioLeonBudgetProcessor(StandardBudgetProcessor):
-    def extract_asset_name(self, cell_ref="D4", tab_name="2024 Budget vs Actual"):
-        return super().extract_asset_name(cell_ref=cell_ref, tab_name=tab_name)
+class InvoiceApprovalsProcessor:
+    """Invoice approval rows of one workbook; the header row and column names come from ``layout``.
 
-    def extract_monthly_data(self, tab_name="2024 Budget vs Actual"):
-        return super().extract_monthly_data(tab_name=tab_name)
+    Without a layout the workbook is sniffed on first use (see registry.sniff_layout).
+    """
 
-class InvoiceApprovalsProcessor:
-    def __init__(self, file_path, db_url):
+    def __init__(self, file_path, db_url, cache=None, layout=None):
         self.file_path = file_path
         self.db_url = db_url
+        self.cache = cache if cache is not None else workbook_cache
+        self.layout = layout
         self.data = None
-
-    def extract_invoice_data(self, tab_name="2024 Invoice Approvals"):
-        xl = pd.ExcelFile(self.file_path)
-        sheet = xl.parse(tab_name, header=None)
-
-        row_offset = 3
-        if "OneVictorei" in self.file_path:
-            row_offset = 4
-
-        headers = sheet.iloc[row_offset, :].astype(str).str.strip().tolist()
-
-        required_col_names = {
-            "Jira Number (Purchase Order)": "Jira Number (Purchase Order)",
-            "Vendor (Contractor)": "Vendor (Contractor)",
-            "Description": "Description",
-            "Budget Line": "Budget Line",
-            "Due Date": "Due Date",
-            "Invoice Net Amount (Euro)": "Invoice Net Amount (Euro)",
-            "Invoice Gross Amount (Euro)": "Invoice Gross Amount (Euro)",
-            "Country Office Approval (Date)": "Country Office Approval (Date)",
-            "HQ Approval (Date)": "HQ Approval (Date)",
-            "Invoice Payment Date": "Invoice Payment Date"
-        }
-
-        # Handle Espacio Leon's specific column names
-        if "EspacioLeon" in self.file_path:
-            column_mapping = {
-                "PO Number       (Purchase Order)": "Jira Number (Purchase Order)",
-                "Vendor": "Vendor (Contractor)"
-            }
-
-            # Update headers dynamically
-            headers = [column_mapping.get(col, col) for col in headers]
-
-            # Get column indices **after mapping**
-        col_indices = {col: headers.index(col) for col in required_col_names if col in headers}
-
-        if len(col_indices) != len(required_col_names):
-            missing_cols = set(required_col_names.keys()) - set(col_indices.keys())
+        self.bad_cells = None
+
+    @instrumented
+    def extract_invoice_data(self, tab_name=None):
+        """Extract the invoice rows with typed columns (see INVOICE_COLUMN_TYPES).
+
+        Cells that cannot be read as a date or an amount are left empty, texts
+        longer than their column are cut, and both are collected in
+        ``self.bad_cells``.
+        """
+        if self.layout is None:
+            from registry import sniff_layout
+            self.layout = sniff_layout(self.file_path, self.cache)
+        if tab_name is None:
+            tab_name = self.layout["invoice_tab"]
+        if tab_name is None:
+            raise ValueError(f"No '<year> Invoice Approvals' sheet found in {self.file_path}")
+
+        # Columns are located by the sniffed header row, with the workbook's own header spellings mapped
+        header_row = self.layout["invoice_header_row"]
+        col_indices = {col: self.layout["invoice_columns"][col] for col in INVOICE_REQUIRED_COLUMNS
+                       if col in self.layout["invoice_columns"]}
+        if len(col_indices) != len(INVOICE_REQUIRED_COLUMNS):
+            missing_cols = set(INVOICE_REQUIRED_COLUMNS) - set(col_indices)
             raise ValueError(f"Missing expected columns in {self.file_path}: {missing_cols}")
 
-        data = sheet.iloc[row_offset + 1:, list(col_indices.values())]
-        data.columns = [required_col_names[col] for col in col_indices.keys()]
+        # Read only the columns that are actually needed
+        first_col = min(col_indices.values())
+        block = self.cache.get_range(
+            self.file_path, tab_name,
+            min_row=header_row + 1, min_col=first_col, max_col=max(col_indices.values())
+        )
+        data = block.iloc[:, [i - first_col for i in col_indices.values()]].copy()
+        data.columns = list(col_indices)
 
-        asset_name = StandardBudgetProcessor(self.file_path, self.db_url).extract_asset_name()
+        # The asset cell is already cached by the budget pass, so this does not re-read it
+        asset_name = StandardBudgetProcessor(self.file_path, self.db_url, cache=self.cache,
+                                             layout=self.layout).extract_asset_name()
         data["Asset"] = asset_name  # Store correct asset per file
 
         self.data = data.dropna(how='all', subset=[col for col in data.columns if col != 'Asset'])
         # Remove aggregate rows where column A (first column) is populated
         self.data = self.data[self.data.iloc[:, 0].isna() == False]
+
+        self.data, cut_texts = to_text(self.data, {**INVOICE_TEXT_COLUMNS, "Asset": 255})
+        self.data, bad_dates = to_dates(self.data, INVOICE_DATE_COLUMNS)
+        self.data, bad_amounts = to_float(self.data, INVOICE_AMOUNT_COLUMNS)
+        self.bad_cells = pd.concat([bad_dates, bad_amounts, cut_texts], ignore_index=True)
         return self.data
 
-    def upload_invoice_data_to_sql(self, table_name="invoice_approvals"):
+    @instrumented
+    def upload_invoice_data_to_sql(self, table_name=INVOICE_TABLE):
         if self.data is None:
             raise ValueError("No data to upload. Run extract_invoice_data() first.")
 
-        column_types = {"Asset": types.VARCHAR(255)}
-        for col in self.data.columns:
-            max_len = self.data[col].astype(str).str.len().max()
-            col_size = min(max(255, max_len), 1000)
-            column_types[col] = types.VARCHAR(col_size)
-
-        engine = create_engine(self.db_url)
-        with engine.connect() as conn:
-            self.data.to_sql(
-                table_name,
-                con=conn,
-                if_exists="replace",
-                index=False,
-                dtype=column_types
-            )
+        engine = get_engine(self.db_url)
+        with engine.begin() as conn:
+            load_table(conn, self.data, table_name, dtype=INVOICE_COLUMN_TYPES, indexes=INVOICE_INDEXES)
 
         print(f"Invoice approvals data uploaded to table: {table_name}")
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+from extractor_class import EXTRACTOR_VERSION
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; without it the cache is simply disabled
+    feather = None
+
+# Set ITAM_FRAME_CACHE_DIR to an empty string to turn the cache off
+FRAME_CACHE_DIR = os.environ.get("ITAM_FRAME_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "itam_frames"))
+
+
+class FrameCache:
+    """On-disk cache of extracted per-workbook frames as uncompressed Arrow (Feather v2) files.
+
+    Entries are keyed by the workbook's content hash, the extractor version and
+    the extraction variant (processor class, tab name), so an unchanged workbook
+    is never opened again. Files are memory-mapped on read.
+    """
+
+    def __init__(self, cache_dir=FRAME_CACHE_DIR, version=EXTRACTOR_VERSION):
+        self.cache_dir = cache_dir
+        self.version = version
+
+    @property
+    def enabled(self):
+        return feather is not None and bool(self.cache_dir)
+
+    def _path(self, content_hash, part, variant=""):
+        key = hashlib.sha256(f"{content_hash}:{self.version}:{part}:{variant}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.arrow")
+
+    def get(self, content_hash, part, variant=""):
+        """Return the cached frame, or None on a miss (or when the cache is disabled)."""
+        if not self.enabled:
+            return None
+        path = self._path(content_hash, part, variant)
+        if not os.path.exists(path):
+            return None
+        try:
+            return feather.read_table(path, memory_map=True).to_pandas()
+        except Exception as e:
+            print(f"Ignoring unreadable frame cache entry {path}: {e}")
+            return None
+
+    def put(self, content_hash, part, df, variant=""):
+        """Store a frame; returns False if it cannot be cached (e.g. mixed-type object columns)."""
+        if not self.enabled or df is None:
+            return False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(content_hash, part, variant)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            feather.write_feather(df, tmp_path, compression="uncompressed")
+            os.replace(tmp_path, path)  # atomic, so parallel workers never see a partial file
+            return True
+        except Exception as e:
+            print(f"Could not cache {part} frame: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+
+# Shared by ingestion and costcenters.py
+frame_cache = FrameCache()
@@ -0,0 +1,98 @@
+import pandas as pd
+import sqlalchemy.types as types
+
+from normalize import ACTUAL_CODE_SUFFIX
+
+# Parent-Child relationship of the budget cost codes. The '-A' (Actual) mirror is derived from it.
+PARENT_CHILD_HIERARCHY = {
+    "10430": ["10400", "10432", "10408", "10404", "10402", "10433", "10401"],
+    "21000": ["10420", "10405", "10450"],
+    "21010": ["21011", "21021", "21026", "21031", "21041", "21022"],
+    "21046": ["21246", "21248"],
+    "21120": ["21101", "21102", "21103", "21104", "21105", "21106", "21107", "21221", "CW00007", "21108", "21111"],
+    "21121": ["21051", "21061", "21071", "21081", "21110", "21170", "21220"],
+    "21219": ["21091", "21190", "21200"],
+    "21050": ["21010", "21046", "21120", "21121", "21219"],
+    "22200": ["22101", "21100", "10430"],
+    "22210": ["22200", "21230", "21240", "21180", "21250", "21260", "21270", "21280", "21290", "21320", "21360",
+              "CW0004", "CW0005", "21362", "21400", "21366", "24046", "24030", "24010", "24050"],
+    "30040": ["30040LC", "30040CLC", "30012", "30030"],
+    "30090": ["30051", "30052", "30053", "30054", "30055", "30056", "30057", "30058"],
+    "23400": ["22210", "30040", "30090"],
+    "27090": ["24040", "24042", "24045", "27010", "24048"],
+    "35999": ["26000", "26003", "31010", "26010", "31020"],
+    "39999": ["39030"]
+}
+
+CLOSURE_TABLE = "costcenter_closure"
+
+CLOSURE_COLUMN_TYPES = {
+    "Ancestor Cost Code": types.VARCHAR(50),
+    "Descendant Cost Code": types.VARCHAR(50),
+    "Depth": types.INTEGER,
+}
+
+
+def with_actual_mirror(hierarchy):
+    """Add the '-A' Actual copy of every parent-child pair."""
+    mirrored = dict(hierarchy)
+    for parent, children in hierarchy.items():
+        mirrored[parent + ACTUAL_CODE_SUFFIX] = [child + ACTUAL_CODE_SUFFIX for child in children]
+    return mirrored
+
+
+# Plain and Actual codes together, as used by the costcenters table
+COST_CENTER_HIERARCHY = with_actual_mirror(PARENT_CHILD_HIERARCHY)
+
+
+def child_to_parent(hierarchy=COST_CENTER_HIERARCHY):
+    """Reverse the hierarchy for direct parent lookups."""
+    return {child: parent for parent, children in hierarchy.items() for child in children}
+
+
+def closure_table(hierarchy=COST_CENTER_HIERARCHY):
+    """Transitive closure of the hierarchy: one row per (ancestor, descendant) with the depth between them.
+
+    Every code is also its own ancestor at depth 0, so rollups include the code itself.
+    """
+    parents = child_to_parent(hierarchy)
+    codes = set(hierarchy) | set(parents)
+
+    rows = []
+    for code in sorted(codes):
+        rows.append((code, code, 0))
+        ancestor, depth, seen = parents.get(code), 1, {code}
+        while ancestor is not None and ancestor not in seen:
+            rows.append((ancestor, code, depth))
+            seen.add(ancestor)
+            ancestor, depth = parents.get(ancestor), depth + 1
+
+    return pd.DataFrame(rows, columns=list(CLOSURE_COLUMN_TYPES))
+
+
+def rollup(budget_df, closure=None, hierarchy=COST_CENTER_HIERARCHY, value_column="Érték",
+           group_columns=("Asset", "Hónap")):
+    """Aggregate long-format budget values up the cost-center tree.
+
+    Only leaf lines are summed (aggregate lines already hold totals in the
+    workbooks), and each leaf is joined once to all of its ancestors through the
+    closure table, so every level of the tree comes out of a single join and
+    group-by. Codes outside the hierarchy roll up to themselves only.
+    Returns one row per ancestor code and group with the summed value.
+    """
+    if closure is None:
+        closure = closure_table(hierarchy)
+    group_columns = list(group_columns)
+
+    leaves = budget_df.loc[~budget_df["Cost Code"].isin(hierarchy.keys()),
+                           ["Cost Code", *group_columns, value_column]]
+    leaves = leaves.astype({"Cost Code": str})
+
+    joined = leaves.merge(closure[["Ancestor Cost Code", "Descendant Cost Code"]],
+                          left_on="Cost Code", right_on="Descendant Cost Code", how="left")
+    joined["Ancestor Cost Code"] = joined["Ancestor Cost Code"].fillna(joined["Cost Code"])
+
+    return (joined.groupby(["Ancestor Cost Code", *group_columns], observed=True, sort=True)[value_column]
+            .sum()
+            .reset_index()
+            .rename(columns={"Ancestor Cost Code": "Cost Code"}))
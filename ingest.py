@@ -0,0 +1,165 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from extractor_class import InvoiceApprovalsProcessor
+from frame_cache import frame_cache
+from instrumentation import recorder
+from manifest import content_hash as file_content_hash
+from registry import layout_cache, workbook_layout
+
+# Number of worker processes used for ingestion; 1 runs everything in-process
+INGEST_WORKERS = int(os.environ.get("ITAM_INGEST_WORKERS", os.cpu_count() or 1))
+
+
+# Error stages of the invoice and cost-center parts; every other stage belongs to the budget part,
+# except "open", "layout" and "worker", which fail the whole workbook
+INVOICE_ERROR_STAGE = "invoice approvals"
+COSTCENTER_ERROR_STAGE = "cost centers"
+
+
+def part_failed(errors, part):
+    """Whether one of a workbook's (stage, message) errors affects 'budget', 'invoices' or 'costcenters'."""
+    for stage, _ in errors:
+        if stage in ("open", "layout", "worker"):
+            return True
+        owner = {INVOICE_ERROR_STAGE: "invoices", COSTCENTER_ERROR_STAGE: "costcenters"}.get(stage, "budget")
+        if owner == part:
+            return True
+    return False
+
+
+def process_workbook(file_path, processor_class, db_url, extract_budget=True, extract_invoices=False,
+                     extract_costcenters=False, tab_name=None, content_hash=None):
+    """Run every extraction step for one workbook, opening it at most once.
+
+    Returns a dict with the budget year, the long-format budget frame (see
+    to_long_format), the cells that could not be parsed as numbers, the
+    invoice frame and its unparseable date/amount cells, the cost-center rows
+    (see extract_costcenters) and a list of (stage, message) errors. A failing
+    stage is recorded and skips the rest of that part of the workbook instead
+    of raising.
+
+    Frames of an unchanged workbook (same ``content_hash``) are served from the
+    on-disk frame cache without opening the workbook at all.
+
+    The stage timings recorded while processing the workbook are returned under
+    ``metrics`` so they survive the trip back from a worker process.
+    """
+    with recorder.capture() as metrics:
+        with recorder.stage("process_workbook", file=file_path) as record:
+            result = _process_workbook(file_path, processor_class, db_url, extract_budget, extract_invoices,
+                                       extract_costcenters, tab_name, content_hash)
+            record["rows_out"] = sum(len(result[part]) for part in ("budget", "invoices", "costcenters")
+                                     if result[part] is not None)
+            if result["errors"]:
+                record["status"] = "error"
+                record["error"] = "; ".join(f"{stage}: {message}" for stage, message in result["errors"])
+    result["metrics"] = metrics
+    return result
+
+
+def _process_workbook(file_path, processor_class, db_url, extract_budget, extract_invoices, extract_costcenters,
+                      tab_name, content_hash):
+    result = {"file_path": file_path, "budget": None, "bad_cells": None, "invoices": None, "invoice_bad_cells": None,
+              "costcenters": None, "errors": []}
+
+    if not os.path.exists(file_path):
+        result["errors"].append(("open", f"File not found: {file_path}"))
+        return result
+
+    if content_hash is None and (frame_cache.enabled or layout_cache.enabled):
+        content_hash = file_content_hash(file_path)
+    budget_variant = f"{processor_class.__name__}:{tab_name}"
+
+    # Sheet names and the first rows only; cached per content hash, so unchanged workbooks are not sniffed again
+    try:
+        layout = workbook_layout(file_path, content_hash)
+    except Exception as e:
+        result["errors"].append(("layout", str(e)))
+        return result
+
+    # The budget year, so the rows of an emptied budget sheet can be removed
+    result["year"] = layout["year"]
+
+    # One processor, and so one read of the budget range, for the budget and cost-center parts
+    processor = processor_class(file_path, db_url, layout=layout)
+
+    if extract_budget:
+        result["budget"] = frame_cache.get(content_hash, "budget", budget_variant)
+        if result["budget"] is not None:
+            result["bad_cells"] = frame_cache.get(content_hash, "bad_cells", budget_variant)
+        else:
+            stage = "asset name"
+            try:
+                processor.extract_asset_name(tab_name=tab_name)
+                stage = "monthly data"
+                processor.extract_monthly_data(tab_name=tab_name)
+                stage = "cost code"
+                processor.modify_cost_code()
+                stage = "numeric conversion"
+                result["bad_cells"] = processor.convert_monthly_values()
+                stage = "long format"
+                result["budget"] = processor.to_long_format()
+                frame_cache.put(content_hash, "budget", result["budget"], budget_variant)
+                frame_cache.put(content_hash, "bad_cells", result["bad_cells"], budget_variant)
+            except Exception as e:
+                result["errors"].append((stage, str(e)))
+
+    # Workbooks without an invoice approvals sheet simply have no invoices
+    if extract_invoices and layout["invoice_tab"] is not None:
+        result["invoices"] = frame_cache.get(content_hash, "invoices")
+        if result["invoices"] is not None:
+            result["invoice_bad_cells"] = frame_cache.get(content_hash, "invoice_bad_cells")
+        else:
+            try:
+                invoice_processor = InvoiceApprovalsProcessor(file_path, db_url, layout=layout)
+                result["invoices"] = invoice_processor.extract_invoice_data()
+                result["invoice_bad_cells"] = invoice_processor.bad_cells
+                frame_cache.put(content_hash, "invoices", result["invoices"])
+                frame_cache.put(content_hash, "invoice_bad_cells", result["invoice_bad_cells"])
+            except Exception as e:
+                result["errors"].append((INVOICE_ERROR_STAGE, str(e)))
+
+    if extract_costcenters:
+        result["costcenters"] = frame_cache.get(content_hash, "costcenters", budget_variant)
+        if result["costcenters"] is None:
+            try:
+                result["costcenters"] = processor.extract_costcenters(tab_name=tab_name)
+                frame_cache.put(content_hash, "costcenters", result["costcenters"], budget_variant)
+            except Exception as e:
+                result["errors"].append((COSTCENTER_ERROR_STAGE, str(e)))
+
+    return result
+
+
+def _run_job(job):
+    return process_workbook(**job)
+
+
+def iter_ingest_workbooks(jobs, workers=INGEST_WORKERS):
+    """Process workbook jobs (keyword dicts for process_workbook) and yield (index, result) as each one finishes.
+
+    With workers > 1 the jobs run in parallel worker processes and results
+    arrive in completion order, so the caller can start loading the first
+    workbooks while the rest are still being parsed.
+    """
+    if workers <= 1 or len(jobs) <= 1:
+        for index, job in enumerate(jobs):
+            result = _run_job(job)
+            recorder.extend(result["metrics"])
+            yield index, result
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+        futures = {executor.submit(_run_job, job): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died (e.g. BrokenProcessPool); keep the rest of the run going
+                result = {"file_path": jobs[index]["file_path"], "budget": None, "bad_cells": None,
+                          "invoices": None, "invoice_bad_cells": None, "costcenters": None,
+                          "errors": [("worker", str(e))], "metrics": []}
+            recorder.extend(result["metrics"])
+            yield index, result
@@ -0,0 +1,232 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Where the run report is written; set ITAM_PROMETHEUS_TEXTFILE to also export node-exporter textfile metrics
+RUN_REPORT_PATH = os.environ.get("ITAM_RUN_REPORT", "itam_run_report.json")
+PROMETHEUS_TEXTFILE = os.environ.get("ITAM_PROMETHEUS_TEXTFILE")
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident memory over its whole lifetime, or None if it cannot be read."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB on Linux
+    except ImportError:  # Windows
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, "peak_wset", info.rss)
+        except ImportError:
+            return None
+
+
+def rss_bytes():
+    """Current resident memory of this process, or None if it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        try:
+            with open("/proc/self/statm") as f:  # Linux without psutil
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+
+def _row_count(value):
+    return len(value) if isinstance(value, pd.DataFrame) else None
+
+
+class RunRecorder:
+    """Collects wall time, CPU time, memory and row counts per stage and per file.
+
+    A stage's ``rss_delta_bytes`` is how much the process's resident memory
+    grew (or shrank) between its start and end; it includes whatever other
+    threads (e.g. table writers) allocated meanwhile. ``process_peak_rss_bytes``
+    is the process's lifetime high-water mark when the stage ended, not the
+    stage's own peak.
+    """
+
+    def __init__(self, job="main"):
+        self.job = job
+        self.started = time.time()
+        self.records = []
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name, file=None, rows_in=None):
+        """Time a block. Set ``rows_out`` on the yielded record to report the output size."""
+        record = {"stage": name, "file": os.path.basename(file) if file else None,
+                  "rows_in": rows_in, "rows_out": None, "status": "ok"}
+        wall, cpu = time.perf_counter(), time.process_time()
+        record["rss_start_bytes"] = rss_start = rss_bytes()
+        try:
+            yield record
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+            raise
+        finally:
+            record["wall_seconds"] = round(time.perf_counter() - wall, 6)
+            record["cpu_seconds"] = round(time.process_time() - cpu, 6)
+            rss_end = rss_bytes()
+            record["rss_delta_bytes"] = None if rss_start is None or rss_end is None else rss_end - rss_start
+            record["process_peak_rss_bytes"] = peak_rss_bytes()
+            record["pid"] = os.getpid()
+            sink = getattr(self._local, "sink", None)
+            (sink if sink is not None else self.records).append(record)
+
+    @contextmanager
+    def capture(self):
+        """Collect the records of this thread's stages in the yielded list instead of ``records``.
+
+        Used to ship a workbook's records back from a worker process; stages
+        timed meanwhile on other threads (e.g. table writers) are unaffected.
+        """
+        previous = getattr(self._local, "sink", None)
+        self._local.sink = captured = []
+        try:
+            yield captured
+        finally:
+            self._local.sink = previous
+
+    def extend(self, records):
+        """Merge records collected elsewhere, e.g. in an ingestion worker process."""
+        self.records.extend(records or [])
+
+    def summary(self):
+        """Totals per stage across all files."""
+        stages = {}
+        for r in self.records:
+            total = stages.setdefault(r["stage"], {
+                "stage": r["stage"], "calls": 0, "errors": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                "rows_out": None, "max_rss_delta_bytes": None,
+            })
+            total["calls"] += 1
+            total["errors"] += r["status"] == "error"
+            total["wall_seconds"] = round(total["wall_seconds"] + r["wall_seconds"], 6)
+            total["cpu_seconds"] = round(total["cpu_seconds"] + r["cpu_seconds"], 6)
+            if r["rows_out"] is not None:
+                total["rows_out"] = (total["rows_out"] or 0) + r["rows_out"]
+            delta = r.get("rss_delta_bytes")
+            if delta is not None and (total["max_rss_delta_bytes"] is None or delta > total["max_rss_delta_bytes"]):
+                total["max_rss_delta_bytes"] = delta
+        return list(stages.values())
+
+    def report(self):
+        finished = time.time()
+        return {
+            "job": self.job,
+            "started": self.started,
+            "finished": finished,
+            "wall_seconds": round(finished - self.started, 6),
+            "process_peak_rss_bytes": peak_rss_bytes(),
+            "errors": sum(r["status"] == "error" for r in self.records),
+            "stages": self.summary(),
+            "records": self.records,
+        }
+
+    def write_json(self, path=RUN_REPORT_PATH):
+        report = self.report()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        return report
+
+    def write_prometheus(self, path=PROMETHEUS_TEXTFILE):
+        """Write metrics in the Prometheus textfile-collector format (atomically, via rename)."""
+        report = self.report()
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                labels = {"job": self.job, **labels}
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items() if v is not None)
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        per_file = {}
+        for r in self.records:
+            if r["file"]:
+                key = (r["stage"], r["file"])
+                per_file[key] = round(per_file.get(key, 0.0) + r["wall_seconds"], 6)
+        metric("itam_run_wall_seconds", "Wall time of the whole run.", [({}, report["wall_seconds"])])
+        metric("itam_run_errors", "Stages that failed in the run.", [({}, report["errors"])])
+        metric("itam_run_peak_rss_bytes", "Peak resident memory of the main process over the whole run.",
+               [({}, report["process_peak_rss_bytes"])])
+        metric("itam_run_finished_timestamp_seconds", "Unix time the run finished.", [({}, report["finished"])])
+        metric("itam_stage_wall_seconds", "Total wall time per stage.",
+               [({"stage": s["stage"]}, s["wall_seconds"]) for s in report["stages"]])
+        metric("itam_stage_cpu_seconds", "Total CPU time per stage.",
+               [({"stage": s["stage"]}, s["cpu_seconds"]) for s in report["stages"]])
+        metric("itam_stage_max_rss_delta_bytes", "Largest growth of resident memory during one call of a stage.",
+               [({"stage": s["stage"]}, s["max_rss_delta_bytes"]) for s in report["stages"]])
+        metric("itam_stage_rows_out", "Rows produced per stage.",
+               [({"stage": s["stage"]}, s["rows_out"]) for s in report["stages"]])
+        metric("itam_file_stage_wall_seconds", "Wall time per stage and workbook.",
+               [({"stage": stage, "file": file}, seconds) for (stage, file), seconds in per_file.items()])
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def finish(self, report_path=RUN_REPORT_PATH, prometheus_path=PROMETHEUS_TEXTFILE):
+        """Write the JSON report (and the Prometheus textfile if configured) at the end of a run.
+
+        Jobs other than "main" get their own files (``itam_run_report.costcenters.json``)
+        so the two scripts do not overwrite each other's report.
+        """
+        report_path = _for_job(report_path, self.job)
+        report = self.write_json(report_path)
+        if prometheus_path:
+            self.write_prometheus(_for_job(prometheus_path, self.job))
+        print(f"Run report written to {report_path} ({report['wall_seconds']:.1f} s, {report['errors']} error(s)).")
+        return report
+
+
+def _for_job(path, job):
+    if job == "main":
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{job}{ext}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide recorder used by the instrumented processor methods and the scripts
+recorder = RunRecorder()
+
+
+def instrumented(method=None, *, rows_out="result"):
+    """Record a processor method as a stage of the processor's workbook.
+
+    Rows in are the processor's current ``data`` rows. Rows out are the
+    returned DataFrame's rows, or ``data``'s rows after the call when the
+    method returns nothing or ``rows_out="data"`` is given.
+    """
+    if method is None:
+        return functools.partial(instrumented, rows_out=rows_out)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        data = getattr(self, "data", None)
+        with recorder.stage(method.__name__, file=getattr(self, "file_path", None),
+                            rows_in=_row_count(data)) as record:
+            result = method(self, *args, **kwargs)
+            count = _row_count(result) if rows_out == "result" else None
+            record["rows_out"] = count if count is not None else _row_count(getattr(self, "data", None))
+            return result
+    return wrapper
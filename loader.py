@@ -0,0 +1,314 @@
+import csv
+import io
+import os
+import queue
+import threading
+from functools import lru_cache
+
+import pandas as pd
+from sqlalchemy import bindparam, create_engine, inspect, text
+from sqlalchemy.types import to_instance
+
+from instrumentation import recorder
+
+# Rows per executemany batch on databases without COPY support (e.g. SQLite)
+INSERT_BATCH_SIZE = 5000
+
+# Frames a table writer may have waiting before the producer blocks
+WRITE_QUEUE_SIZE = int(os.environ.get("ITAM_WRITE_QUEUE_SIZE", 4))
+
+
+@lru_cache(maxsize=None)
+def get_engine(db_url):
+    """Return the process-wide pooled engine for a database URL."""
+    return create_engine(db_url, pool_pre_ping=True)
+
+
+def _quote(conn, name):
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def _staging_name(table_name):
+    return f"{table_name}__staging"
+
+
+def _copy_frame(conn, df, table_name):
+    """Stream a DataFrame into an existing PostgreSQL table with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    # Missing values are written as \N, so empty strings stay '' instead of becoming NULL
+    df.to_csv(buffer, index=False, header=False, quoting=csv.QUOTE_MINIMAL, na_rep="\\N",
+              date_format="%Y-%m-%d %H:%M:%S")
+    buffer.seek(0)
+
+    columns = ", ".join(_quote(conn, col) for col in df.columns)
+    sql = f"COPY {_quote(conn, table_name)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+
+    # Runs on the DBAPI connection underneath conn, so it is part of the same transaction
+    cursor = conn.connection.cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    finally:
+        cursor.close()
+
+
+def append_frame(conn, df, table_name):
+    """Append rows to an existing table: COPY on PostgreSQL, batched executemany elsewhere."""
+    if df.empty:
+        return
+    if conn.dialect.name == "postgresql":
+        _copy_frame(conn, df, table_name)
+    else:
+        df.to_sql(table_name, con=conn, if_exists="append", index=False, chunksize=INSERT_BATCH_SIZE)
+
+
+def ensure_indexes(conn, table_name, indexes):
+    """Create the given indexes (tuples of column names) on a table unless they exist."""
+    for columns in indexes or ():
+        name = "_".join([table_name, *columns, "idx"])
+        name = "".join(c if c.isalnum() else "_" for c in name).lower()
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {_quote(conn, name)} ON {_quote(conn, table_name)} "
+            f"({', '.join(_quote(conn, col) for col in columns)})"
+        ))
+
+
+def table_matches_types(engine, table_name, dtype):
+    """False if the table exists but lacks a column of ``dtype`` or stores it as a different kind of type.
+
+    A text column shorter than in ``dtype`` counts as different too. Used to
+    notice a schema change (e.g. text columns that became DATE or wider) that
+    an asset-level merge into the old table could not apply.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(table_name):
+        return True
+    existing = {col["name"]: col["type"] for col in inspector.get_columns(table_name)}
+
+    def python_type(sql_type):
+        try:
+            return to_instance(sql_type).python_type
+        except NotImplementedError:
+            return None
+
+    def shorter(existing_type, sql_type):
+        length = getattr(to_instance(sql_type), "length", None)
+        existing_length = getattr(existing_type, "length", None)
+        return existing_length is not None and (length is None or existing_length < length)
+
+    return all(col in existing and python_type(existing[col]) == python_type(sql_type)
+               and not shorter(existing[col], sql_type)
+               for col, sql_type in dtype.items())
+
+
+# Called with (table_name, assets) whenever a load replaces rows; assets=None means the whole table
+_replace_listeners = []
+
+# Load counter per table and asset, so other processes (dashboards, notebooks) can tell their cached results are stale
+LOAD_VERSIONS_TABLE = "load_versions"
+# The "Asset" of the row bumped when a whole table is replaced
+WHOLE_TABLE = "*"
+
+
+def add_replace_listener(listener):
+    """Register ``listener(table_name, assets)`` to hear about every load, e.g. to drop cached query results."""
+    _replace_listeners.append(listener)
+
+
+def ensure_load_versions_table(conn):
+    conn.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {LOAD_VERSIONS_TABLE} ("Table Name" VARCHAR(255) NOT NULL, '
+        f'"Asset" VARCHAR(255) NOT NULL, "Version" BIGINT NOT NULL, PRIMARY KEY ("Table Name", "Asset"))'
+    ))
+
+
+def bump_load_versions(conn, table_name, assets=None):
+    """Give the replaced assets (or the whole table) of ``table_name`` a new, higher load version."""
+    ensure_load_versions_table(conn)
+    keys = [WHOLE_TABLE] if assets is None else sorted(assets)
+    if not keys:
+        return
+    version = conn.execute(
+        text(f'SELECT COALESCE(MAX("Version"), 0) + 1 FROM {LOAD_VERSIONS_TABLE} WHERE "Table Name" = :table'),
+        {"table": table_name}
+    ).scalar()
+    conn.execute(
+        text(f'DELETE FROM {LOAD_VERSIONS_TABLE} WHERE "Table Name" = :table AND "Asset" IN :assets')
+        .bindparams(bindparam("assets", expanding=True)),
+        {"table": table_name, "assets": keys}
+    )
+    conn.execute(
+        text(f'INSERT INTO {LOAD_VERSIONS_TABLE} ("Table Name", "Asset", "Version") VALUES (:table, :asset, :version)'),
+        [{"table": table_name, "asset": asset, "version": version} for asset in keys]
+    )
+
+
+def notify_replaced(table_name, assets=None, conn=None):
+    """Tell the listeners that a table's rows (only those assets' rows unless None) were replaced.
+
+    With ``conn`` (the load's transaction) the load versions are bumped too,
+    so the change is visible to other processes once the load commits.
+    """
+    if conn is not None:
+        bump_load_versions(conn, table_name, assets)
+    for listener in _replace_listeners:
+        listener(table_name, assets)
+
+
+def swap_table(conn, staging, table_name):
+    """Replace ``table_name`` with the staging table by renaming it."""
+    conn.execute(text(f"DROP TABLE IF EXISTS {_quote(conn, table_name)}"))
+    conn.execute(text(f"ALTER TABLE {_quote(conn, staging)} RENAME TO {_quote(conn, table_name)}"))
+
+
+def delete_asset_rows(conn, table_name, assets, condition="", params=None):
+    """Delete the given assets' rows of a table, optionally narrowed by an extra SQL ``condition``."""
+    conn.execute(
+        text(f'DELETE FROM {_quote(conn, table_name)} WHERE "Asset" IN :assets{condition}')
+        .bindparams(bindparam("assets", expanding=True)),
+        {**(params or {}), "assets": sorted(assets)}
+    )
+
+
+class StagedLoad:
+    """Streams frames into a staging table and publishes them in one step.
+
+    Create it inside ``engine.begin()``, call ``append`` once per chunk (e.g.
+    per workbook) and ``finish`` at the end. With ``assets=None`` the staging
+    table replaces the target; otherwise only those assets' rows are replaced.
+    ``assets`` may be set right before ``finish`` when it is only known after
+    the last chunk. ``indexes`` (tuples of column names) are created on the
+    target after the load. Nothing is visible to readers until the surrounding
+    transaction commits. Without any frame, the given assets' rows are only
+    deleted (their workbooks are gone), and with ``assets=None`` nothing changes.
+    """
+
+    def __init__(self, conn, table_name, dtype=None, assets=None, indexes=None):
+        self.conn = conn
+        self.table_name = table_name
+        self.dtype = dtype
+        self.assets = assets
+        self.indexes = indexes
+        self.staging = _staging_name(table_name)
+        self.columns = None
+        self.rows = 0
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+            df.head(0).to_sql(self.staging, con=self.conn, if_exists="replace", index=False, dtype=self.dtype)
+        append_frame(self.conn, df[self.columns], self.staging)
+        self.rows += len(df)
+
+    def finish(self):
+        """Swap or merge the staged rows into the target table. Returns the number of rows loaded."""
+        conn = self.conn
+        if self.columns is None:
+            if self.assets is not None and inspect(conn).has_table(self.table_name):
+                assets = sorted({a for a in self.assets if pd.notna(a)})
+                if assets:
+                    delete_asset_rows(conn, self.table_name, assets)
+                    notify_replaced(self.table_name, assets, conn)
+            return 0
+
+        if self.assets is None or not inspect(conn).has_table(self.table_name):
+            swap_table(conn, self.staging, self.table_name)
+            ensure_indexes(conn, self.table_name, self.indexes)
+            notify_replaced(self.table_name, conn=conn)
+            return self.rows
+
+        assets = sorted({a for a in self.assets if pd.notna(a)})
+        if assets:
+            delete_asset_rows(conn, self.table_name, assets)
+        columns = ", ".join(_quote(conn, col) for col in self.columns)
+        conn.execute(text(
+            f"INSERT INTO {_quote(conn, self.table_name)} ({columns}) "
+            f"SELECT {columns} FROM {_quote(conn, self.staging)}"
+        ))
+        conn.execute(text(f"DROP TABLE {_quote(conn, self.staging)}"))
+        ensure_indexes(conn, self.table_name, self.indexes)
+        notify_replaced(self.table_name, assets, conn)
+        return self.rows
+
+
+def load_table(conn, df, table_name, dtype=None, indexes=None):
+    """Replace a whole table with ``df`` through a staging table.
+
+    Run it inside ``engine.begin()``: the old table stays readable while the
+    staging table is filled, and the swap commits together with the load, so
+    readers never see a half-loaded or empty table.
+    """
+    load = StagedLoad(conn, table_name, dtype=dtype, indexes=indexes)
+    load.append(df)
+    load.finish()
+
+
+_DONE = object()
+
+# One lock per database file: SQLite allows a single writer at a time
+_serial_write_locks = {}
+
+
+class TableWriter(threading.Thread):
+    """Loads frames into one table on its own pooled connection while the producer keeps parsing.
+
+    ``start_load(conn)`` returns the load object (e.g. a StagedLoad); every
+    ``put(*args)`` is passed to its ``append`` through a bounded queue, and
+    ``close(**attrs)`` sets ``attrs`` on it, calls ``finish`` and returns its
+    result. The whole load runs in one transaction. On SQLite, which cannot
+    write concurrently, the frames are buffered and loaded one table at a time
+    when the writer is closed.
+    """
+
+    def __init__(self, engine, start_load, name):
+        super().__init__(name=f"{name}_load", daemon=True)
+        self.engine = engine
+        self.start_load = start_load
+        self.queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self.finish_attrs = {}
+        self.result = None
+        self.error = None
+        self.serial = engine.dialect.name == "sqlite"
+
+    def put(self, *args):
+        self.queue.put(args)
+
+    def close(self, **attrs):
+        """Wait for the load to finish and return its result; re-raises the writer's error."""
+        self.finish_attrs = attrs
+        self.queue.put(_DONE)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _chunks(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def run(self):
+        chunks = self._chunks()
+        try:
+            if self.serial:
+                chunks = list(chunks)
+                lock = _serial_write_locks.setdefault(str(self.engine.url), threading.Lock())
+            else:
+                lock = threading.Lock()
+            with lock, recorder.stage(self.name) as record, self.engine.begin() as conn:
+                load = self.start_load(conn)
+                for args in chunks:
+                    load.append(*args)
+                for attr, value in self.finish_attrs.items():
+                    setattr(load, attr, value)
+                self.result = record["rows_out"] = load.finish()
+        except Exception as e:
+            self.error = e
+            # Keep draining so the producer never blocks on a failed writer
+            for _ in chunks:
+                pass
@@ -0,0 +1,133 @@
+import hashlib
+import os
+
+import pandas as pd
+from sqlalchemy import bindparam, inspect, text
+import sqlalchemy.types as types
+
+MANIFEST_TABLE = "workbook_manifest"
+
+MANIFEST_TYPES = {
+    "scope": types.VARCHAR(50),
+    "file_path": types.VARCHAR(1000),
+    "size": types.BIGINT,
+    "mtime": types.FLOAT,
+    "content_hash": types.VARCHAR(64),
+    "asset": types.VARCHAR(255),
+}
+
+
+def normalize_path(file_path):
+    """Absolute, case-normalized path, so one workbook has one manifest row however it was spelled."""
+    return os.path.normcase(os.path.abspath(file_path))
+
+
+def content_hash(file_path, chunk_size=1 << 20):
+    """SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(file_path, previous=None):
+    """Return the path/size/mtime/hash fingerprint of a workbook.
+
+    When a previous fingerprint with the same size and mtime is given, its hash
+    is reused instead of reading the file again.
+    """
+    stat = os.stat(file_path)
+    if previous is not None and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+        digest = previous["content_hash"]
+    else:
+        digest = content_hash(file_path)
+    return {"file_path": normalize_path(file_path), "size": stat.st_size, "mtime": stat.st_mtime,
+            "content_hash": digest}
+
+
+def load_manifest(engine, scope):
+    """Return {normalized file_path: manifest row} for one scope, or {} if nothing was loaded yet."""
+    if not inspect(engine).has_table(MANIFEST_TABLE):
+        return {}
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(f'SELECT * FROM {MANIFEST_TABLE} WHERE scope = :scope'), {"scope": scope}
+        ).mappings().all()
+    # Rows saved before the paths were normalized are matched too
+    return {normalize_path(row["file_path"]): dict(row) for row in rows}
+
+
+def changed_files(engine, file_paths, scope):
+    """Split existing workbooks into changed ones and their fresh fingerprints.
+
+    Returns (changed_paths, fingerprints, manifest) where ``manifest`` is the
+    previously stored state, so callers can find the asset a file used to hold.
+    """
+    manifest = load_manifest(engine, scope)
+    changed, fingerprints = [], {}
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            continue
+        previous = manifest.get(normalize_path(file_path))
+        fingerprints[file_path] = fingerprint(file_path, previous)
+        if previous is None or previous["content_hash"] != fingerprints[file_path]["content_hash"]:
+            changed.append(file_path)
+    return changed, fingerprints, manifest
+
+
+def missing_files(manifest, budgets_dir):
+    """{file_path: manifest row} of the manifest's workbooks in ``budgets_dir`` that no longer exist."""
+    folder = normalize_path(budgets_dir)
+    return {path: row for path, row in manifest.items()
+            if os.path.dirname(path) == folder and not os.path.exists(path)}
+
+
+def _delete_rows(conn, scope, stored_paths):
+    conn.execute(
+        text(f"DELETE FROM {MANIFEST_TABLE} WHERE scope = :scope AND file_path IN :paths")
+        .bindparams(bindparam("paths", expanding=True)),
+        {"scope": scope, "paths": stored_paths}
+    )
+
+
+def _stored_rows(conn, scope, file_paths):
+    """{stored file_path: asset} of the rows of the given files, under any spelling of their paths."""
+    wanted = {normalize_path(path) for path in file_paths}
+    stored = conn.execute(
+        text(f"SELECT file_path, asset FROM {MANIFEST_TABLE} WHERE scope = :scope"), {"scope": scope}
+    ).all()
+    return {path: asset for path, asset in stored if normalize_path(path) in wanted}
+
+
+def save_manifest(conn, scope, fingerprints, assets=None):
+    """Record fingerprints (and the asset each file holds) for the given files.
+
+    A file whose asset is not known this time (e.g. its sheet is now empty)
+    keeps the asset stored before, so a later run can still find its rows.
+    """
+    if not fingerprints:
+        return
+    assets = assets or {}
+    rows = pd.DataFrame([
+        {"scope": scope, **fp, "asset": assets.get(fp["file_path"])} for fp in fingerprints
+    ], columns=list(MANIFEST_TYPES))
+
+    if inspect(conn).has_table(MANIFEST_TABLE):
+        # Also drops the rows of other spellings of the same files (relative paths, '/' vs '\\')
+        stored = _stored_rows(conn, scope, rows["file_path"])
+        if stored:
+            previous = {normalize_path(path): asset for path, asset in stored.items() if asset}
+            rows["asset"] = rows["asset"].where(rows["asset"].notna(), rows["file_path"].map(previous))
+            _delete_rows(conn, scope, list(stored))
+    rows.to_sql(MANIFEST_TABLE, con=conn, if_exists="append", index=False, dtype=MANIFEST_TYPES)
+
+
+def delete_manifest(conn, scope, file_paths):
+    """Forget the given files (e.g. workbooks deleted from the folder)."""
+    if not file_paths or not inspect(conn).has_table(MANIFEST_TABLE):
+        return
+    stored = _stored_rows(conn, scope, file_paths)
+    if stored:
+        _delete_rows(conn, scope, list(stored))
+
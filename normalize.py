@@ -0,0 +1,162 @@
+import pandas as pd
+
+ACTUAL_CODE_SUFFIX = "-A"
+ACTUAL_NAME_SUFFIX = " - Actual"
+
+# A number with at most one decimal point, e.g. "21000", "21000.0" or ".5"
+_NUMERIC_TEXT = r"(?=.*\d)\d*\.?\d*"
+
+
+def _as_text(values):
+    """Strings stay as they are, everything else (numbers, NaN) becomes str or stays missing."""
+    return values.astype("object").where(values.isna(), values.astype(str))
+
+
+def is_numeric_text(values):
+    """True where the value is plain numeric text (digits with at most one '.')."""
+    return _as_text(values).str.fullmatch(_NUMERIC_TEXT).fillna(False).astype(bool)
+
+
+def mark_actual_codes(codes, names):
+    """Append '-A' to the cost codes of lines whose name mentions 'Actual'."""
+    codes = codes.astype(str)
+    is_actual = names.fillna("").astype(str).str.contains("Actual", regex=False)
+    return codes.where(~is_actual, codes + ACTUAL_CODE_SUFFIX)
+
+
+def clean_cost_codes(codes):
+    """Turn numeric cost codes like '21000.0' into '21000'; other codes are kept as text."""
+    text = _as_text(codes)
+    numeric = is_numeric_text(text)
+    cleaned = text.fillna("nan").astype(str)
+    if numeric.any():
+        cleaned[numeric] = pd.to_numeric(text[numeric]).astype("int64").astype(str)
+    return cleaned
+
+
+def fallback_cost_names(names, fallback_names):
+    """Use the fallback name (column B) where the cost name (column C) is only a number."""
+    return names.where(~is_numeric_text(names), fallback_names)
+
+
+def strip_actual_codes(codes):
+    """'21000-A' -> '21000'."""
+    return codes.str.replace(f"{ACTUAL_CODE_SUFFIX}$", "", regex=True)
+
+
+def strip_actual_names(names):
+    """'Cleaning - Actual' -> 'Cleaning'."""
+    return names.str.replace(ACTUAL_NAME_SUFFIX, "", regex=False)
+
+
+def to_float(df, columns):
+    """Convert the given columns to float64, reading comma decimals ('123,5') as well.
+
+    Cells that cannot be parsed become NaN instead of leaving the whole column
+    as object dtype. Returns the converted frame and a DataFrame of the bad
+    cells (row, column, value) so callers can report them.
+    """
+    df = df.copy()
+    bad_cells = []
+    for col in columns:
+        values = df[col]
+        numbers = pd.to_numeric(values, errors="coerce")
+
+        # Only cells that failed the fast path are retried with ',' as the decimal separator
+        retry = numbers.isna() & values.notna()
+        if retry.any():
+            text = _as_text(values[retry]).str.strip()
+            numbers[retry] = pd.to_numeric(text.str.replace(",", ".", regex=False), errors="coerce")
+            # Blank cells are just empty, not bad
+            bad = retry & numbers.isna() & (_as_text(values).str.strip() != "")
+            if bad.any():
+                bad_cells.append(pd.DataFrame({"row": values.index[bad], "column": col,
+                                               "value": values[bad].astype(str)}))
+
+        df[col] = numbers.astype("float64")
+
+    bad_cells = (pd.concat(bad_cells, ignore_index=True) if bad_cells
+                 else pd.DataFrame(columns=["row", "column", "value"]))
+    return df, bad_cells
+
+
+# Excel stores dates as days since 1899-12-30; serials outside this range are not dates
+_EXCEL_EPOCH = "1899-12-30"
+_EXCEL_SERIAL_RANGE = (1, 2958465)
+
+
+def _parse_date_text(text):
+    """Parse stripped date strings: ISO first, then day-first (e.g. '31.01.2024') for the rest."""
+    parsed = pd.to_datetime(text, errors="coerce", format="ISO8601")
+    retry = parsed.isna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(text[retry], errors="coerce", format="mixed", dayfirst=True)
+    return parsed
+
+
+def to_dates(df, columns):
+    """Convert the given columns to datetime64 dates.
+
+    Excel serial numbers are converted from the 1899-12-30 epoch and every
+    other cell (date cells and ISO text) goes through one vectorized
+    to_datetime call; only the cells that fail are parsed again as stripped,
+    day-first strings (e.g. '31.01.2024'). Returns the converted frame and a
+    DataFrame of the cells that could not be parsed, like to_float.
+    """
+    df = df.copy()
+    bad_cells = []
+    for col in columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):  # only date cells (or blanks)
+            df[col] = values.dt.normalize()
+            continue
+        dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+
+        numbers = pd.to_numeric(values, errors="coerce")
+        is_serial = numbers.between(*_EXCEL_SERIAL_RANGE)
+        if is_serial.any():
+            dates[is_serial] = pd.to_datetime(numbers[is_serial], unit="D", origin=_EXCEL_EPOCH)
+
+        # Date cells and ISO strings in one pass
+        is_other = values.notna() & numbers.isna()
+        if is_other.any():
+            dates[is_other] = pd.to_datetime(values[is_other], errors="coerce", format="ISO8601")
+
+        retry = values.notna() & ~is_serial & dates.isna()
+        text = values[retry].astype(str).str.strip()
+        text = text[text != ""]  # blank cells are just empty, not bad
+        if not text.empty:
+            dates[text.index] = _parse_date_text(text)
+            bad = dates.isna() & values.index.isin(text.index)
+            if bad.any():
+                bad_cells.append(pd.DataFrame({"row": values.index[bad], "column": col,
+                                               "value": values[bad].astype(str)}))
+
+        df[col] = dates.dt.normalize()
+
+    bad_cells = (pd.concat(bad_cells, ignore_index=True) if bad_cells
+                 else pd.DataFrame(columns=["row", "column", "value"]))
+    return df, bad_cells
+
+
+def to_text(df, max_lengths):
+    """Convert columns to strings, cut to their maximum length; ``max_lengths`` maps column -> length or None.
+
+    Missing cells stay missing. Returns the converted frame and a DataFrame of
+    the cells that were cut (row, column, full value), like to_float.
+    """
+    df = df.copy()
+    cut_cells = []
+    for col, max_length in max_lengths.items():
+        text = _as_text(df[col])
+        if max_length:
+            too_long = (text.str.len() > max_length).fillna(False).astype(bool)
+            if too_long.any():
+                cut_cells.append(pd.DataFrame({"row": text.index[too_long], "column": col,
+                                               "value": text[too_long]}))
+            text = text.str[:max_length]
+        df[col] = text
+
+    cut_cells = (pd.concat(cut_cells, ignore_index=True) if cut_cells
+                 else pd.DataFrame(columns=["row", "column", "value"]))
+    return df, cut_cells
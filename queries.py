@@ -0,0 +1,215 @@
+"""Cached queries over the loaded budget, invoice and cost-center tables for reports and notebooks.
+
+Results are kept in an in-process LRU cache for ITAM_QUERY_CACHE_TTL seconds.
+Every load bumps the load version of the assets it replaces (the load_versions
+table, see loader.py), and a cached result is only served while the versions
+of its tables and assets are unchanged, so loads run by another process are
+seen on the next call. Loads in the same process also drop the results right away.
+
+    from queries import budget_by_asset_quarter
+    budget_by_asset_quarter(2024, assets=["AI Asset"])
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+from sqlalchemy import bindparam, inspect, text
+
+from budget_storage import BUDGET_TABLE
+from extractor_class import INVOICE_TABLE
+from hierarchy import CLOSURE_TABLE, COST_CENTER_HIERARCHY
+from loader import LOAD_VERSIONS_TABLE, WHOLE_TABLE, add_replace_listener, get_engine
+from normalize import ACTUAL_CODE_SUFFIX, strip_actual_codes
+from pipeline import DB_URL
+from reconciliation import RECONCILIATION_TABLE
+
+# Results kept at most, and for how many seconds
+QUERY_CACHE_SIZE = int(os.environ.get("ITAM_QUERY_CACHE_SIZE", 256))
+QUERY_CACHE_TTL = float(os.environ.get("ITAM_QUERY_CACHE_TTL", 300))
+
+
+class QueryCache:
+    """LRU cache of query results with a time to live.
+
+    Every entry remembers the tables it read and the assets it was limited to
+    (None: all assets), so ``invalidate`` drops only the results a load touched,
+    and the load version it was read at: ``get`` serves it only at that version.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires, tables, assets, version, frame)
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, version=None):
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic() and entry[3] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[4]
+            if entry is not None:  # expired or reloaded since
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, frame, tables, assets=None, version=None):
+        with self.lock:
+            self._entries[key] = (time.monotonic() + self.ttl, frozenset(tables),
+                                  None if assets is None else frozenset(assets), version, frame)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, table_name, assets=None):
+        """Drop the results that read ``table_name`` and cover any of ``assets`` (all of them if None)."""
+        assets = None if assets is None else set(assets)
+        with self.lock:
+            for key, (_, tables, entry_assets, _, _) in list(self._entries.items()):
+                if table_name not in tables:
+                    continue
+                if assets is None or entry_assets is None or entry_assets & assets:
+                    del self._entries[key]
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+
+# Shared by every query; loads in this process drop the results of the assets they replace
+query_cache = QueryCache()
+add_replace_listener(query_cache.invalidate)
+
+# Databases known to have the load_versions table, so it is only looked up until the first load created it
+_versioned_dbs = set()
+
+
+def load_version(db_url, tables, assets=None):
+    """Load versions of ``tables`` for ``assets`` and whole-table loads, as a tuple (None before any load).
+
+    Every bump raises the version of the rows it touches, so the tuple changes
+    whenever one of these tables or assets was reloaded since.
+    """
+    engine = get_engine(db_url)
+    if db_url not in _versioned_dbs:
+        if not inspect(engine).has_table(LOAD_VERSIONS_TABLE):
+            return None
+        _versioned_dbs.add(db_url)
+    query = text(
+        f'SELECT "Table Name", "Asset", "Version" FROM {LOAD_VERSIONS_TABLE} WHERE "Table Name" IN :tables'
+        + (' AND "Asset" IN :assets' if assets is not None else "")
+    ).bindparams(bindparam("tables", expanding=True))
+    params = {"tables": sorted(tables)}
+    if assets is not None:
+        query = query.bindparams(bindparam("assets", expanding=True))
+        params["assets"] = sorted({*assets, WHOLE_TABLE})
+    with engine.connect() as conn:
+        return tuple(sorted(tuple(row) for row in conn.execute(query, params)))
+
+
+def cached_query(sql, params=None, tables=(), assets=None, db_url=DB_URL):
+    """Run a SELECT through the query cache and return its result (shared, do not modify).
+
+    ``tables`` are the tables the query reads and ``assets`` the assets it is
+    limited to, which decide when a load invalidates the result. ``assets`` is
+    bound as the expanding ``:assets`` parameter.
+
+    The load version is read before the query, so a load committing in between
+    leaves the result at the older version and the next call reads it again.
+    """
+    params = dict(params or {})
+    if assets is not None:
+        assets = sorted(assets)
+        params["assets"] = assets
+    key = (db_url, sql, tuple(sorted((name, tuple(value) if isinstance(value, list) else value)
+                                     for name, value in params.items())))
+    version = load_version(db_url, tables, assets)
+    result = query_cache.get(key, version)
+    if result is None:
+        query = text(sql)
+        if assets is not None:
+            query = query.bindparams(bindparam("assets", expanding=True))
+        with get_engine(db_url).connect() as conn:
+            result = pd.read_sql(query, conn, params=params)
+        query_cache.put(key, result, tables, assets, version)
+    return result
+
+
+def _asset_filter(assets, column='"Asset"'):
+    return f" AND {column} IN :assets" if assets is not None else ""
+
+
+def budget_by_asset_quarter(year, assets=None, db_url=DB_URL):
+    """Budget and Actual ('-A' lines) per Asset and Quarter of a year."""
+    sql = f"""
+        SELECT "Asset", "Quarter",
+               SUM(CASE WHEN "Cost Code" LIKE '%{ACTUAL_CODE_SUFFIX}' THEN 0 ELSE "Érték" END) AS "Budget",
+               SUM(CASE WHEN "Cost Code" LIKE '%{ACTUAL_CODE_SUFFIX}' THEN "Érték" ELSE 0 END) AS "Actual"
+        FROM {BUDGET_TABLE}
+        WHERE "Year" = :year{_asset_filter(assets)}
+        GROUP BY "Asset", "Quarter"
+        ORDER BY "Asset", "Quarter"
+    """
+    return cached_query(sql, {"year": int(year)}, tables=[BUDGET_TABLE], assets=assets, db_url=db_url)
+
+
+# Aggregate '-A' lines already hold the totals of their children, so only the leaf lines are summed
+_AGGREGATE_ACTUAL_CODES = ", ".join(f"'{code}'" for code in sorted(COST_CENTER_HIERARCHY)
+                                    if code.endswith(ACTUAL_CODE_SUFFIX))
+
+
+def actuals_by_parent_cost_code(year, assets=None, db_url=DB_URL):
+    """Actual values per Asset rolled up to every ancestor cost code, like hierarchy.rollup.
+
+    Only leaf lines are summed, each code includes itself and codes outside
+    the hierarchy roll up to themselves only.
+    """
+    sql = f"""
+        SELECT b."Asset", COALESCE(c."Ancestor Cost Code", b."Cost Code") AS "Cost Code", SUM(b."Érték") AS "Actual"
+        FROM {BUDGET_TABLE} b
+        LEFT JOIN {CLOSURE_TABLE} c ON c."Descendant Cost Code" = b."Cost Code"
+        WHERE b."Year" = :year AND b."Cost Code" LIKE '%{ACTUAL_CODE_SUFFIX}'
+          AND b."Cost Code" NOT IN ({_AGGREGATE_ACTUAL_CODES}){_asset_filter(assets, 'b."Asset"')}
+        GROUP BY b."Asset", COALESCE(c."Ancestor Cost Code", b."Cost Code")
+        ORDER BY b."Asset", COALESCE(c."Ancestor Cost Code", b."Cost Code")
+    """
+    result = cached_query(sql, {"year": int(year)}, tables=[BUDGET_TABLE, CLOSURE_TABLE], assets=assets,
+                          db_url=db_url)
+    # Reported under the plan code, like the budget lines
+    return result.assign(**{"Cost Code": strip_actual_codes(result["Cost Code"])})
+
+
+def invoices_by_budget_line(assets=None, due_from=None, due_to=None, db_url=DB_URL):
+    """Invoice count and net/gross amounts per Asset and Budget Line, optionally for a Due Date range."""
+    conditions, params = [], {}
+    if due_from is not None:
+        conditions.append('"Due Date" >= :due_from')
+        params["due_from"] = pd.Timestamp(due_from).date()
+    if due_to is not None:
+        conditions.append('"Due Date" <= :due_to')
+        params["due_to"] = pd.Timestamp(due_to).date()
+    sql = f"""
+        SELECT "Asset", "Budget Line", COUNT(*) AS "Invoices",
+               SUM("Invoice Net Amount (Euro)") AS "Net", SUM("Invoice Gross Amount (Euro)") AS "Gross"
+        FROM {INVOICE_TABLE}
+        WHERE 1 = 1{"".join(f" AND {c}" for c in conditions)}{_asset_filter(assets)}
+        GROUP BY "Asset", "Budget Line"
+        ORDER BY "Asset", "Budget Line"
+    """
+    return cached_query(sql, params, tables=[INVOICE_TABLE], assets=assets, db_url=db_url)
+
+
+def reconciliation(year, assets=None, db_url=DB_URL):
+    """Rows of the budget_reconciliation table for a year (see reconciliation.py)."""
+    sql = f"""
+        SELECT * FROM {RECONCILIATION_TABLE}
+        WHERE "Month" >= :start AND "Month" < :end{_asset_filter(assets)}
+        ORDER BY "Asset", "Cost Code", "Month"
+    """
+    params = {"start": pd.Timestamp(year=int(year), month=1, day=1).date(),
+              "end": pd.Timestamp(year=int(year) + 1, month=1, day=1).date()}
+    return cached_query(sql, params, tables=[RECONCILIATION_TABLE], assets=assets, db_url=db_url)
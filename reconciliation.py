@@ -0,0 +1,120 @@
+import pandas as pd
+import sqlalchemy.types as types
+from sqlalchemy import bindparam, inspect, text
+
+from budget_storage import BUDGET_TABLE
+from loader import StagedLoad
+from extractor_class import INVOICE_TABLE
+from normalize import ACTUAL_CODE_SUFFIX, strip_actual_codes, strip_actual_names
+
+# Budget vs. actual vs. invoiced amounts per Asset, cost code and month, for the variance dashboards
+RECONCILIATION_TABLE = "budget_reconciliation"
+
+# Invoices are bucketed into months both by when they are due and by when they were paid
+DATE_BASES = {"Due": "Due Date", "Paid": "Invoice Payment Date"}
+
+RECONCILIATION_COLUMN_TYPES = {
+    "Asset": types.VARCHAR(255),
+    "Cost Code": types.VARCHAR(50),
+    "Cost Name": types.VARCHAR(255),
+    "Month": types.DATE,
+    "Budget": types.FLOAT,
+    "Actual": types.FLOAT,
+    "Invoice Net (Due)": types.NUMERIC(14, 2),
+    "Invoice Gross (Due)": types.NUMERIC(14, 2),
+    "Invoices (Due)": types.INTEGER,
+    "Invoice Net (Paid)": types.NUMERIC(14, 2),
+    "Invoice Gross (Paid)": types.NUMERIC(14, 2),
+    "Invoices (Paid)": types.INTEGER,
+}
+
+RECONCILIATION_INDEXES = [("Asset",), ("Cost Code", "Month")]
+
+KEYS = ["Asset", "Cost Code", "Month"]
+
+
+def budget_line_code(budget_lines):
+    """'21000 - Cleaning' -> '21000': the cost code part of an invoice's Budget Line (see Combined Column)."""
+    return budget_lines.astype("string").str.split(" - ", n=1).str[0].str.strip()
+
+
+def _read(conn, table, columns, assets):
+    """The given columns of a table, only the given assets' rows unless ``assets`` is None."""
+    if not inspect(conn).has_table(table):
+        return pd.DataFrame(columns=columns)
+    sql = "SELECT " + ", ".join(f'"{col}"' for col in columns) + f' FROM "{table}"'
+    if assets is None:
+        return pd.read_sql(text(sql), conn)
+    query = text(f'{sql} WHERE "Asset" IN :assets').bindparams(bindparam("assets", expanding=True))
+    return pd.read_sql(query, conn, params={"assets": assets})
+
+
+def budget_by_month(budget_df):
+    """Budget and Actual ('-A' lines) per Asset, cost code and month."""
+    budget_df = budget_df.assign(**{
+        "Month": pd.to_datetime(budget_df["Hónap"]).dt.to_period("M").dt.to_timestamp(),
+        "Is Actual": budget_df["Cost Code"].astype(str).str.endswith(ACTUAL_CODE_SUFFIX),
+        "Cost Code": strip_actual_codes(budget_df["Cost Code"].astype(str)),
+        "Cost Name": strip_actual_names(budget_df["Cost Name"].astype("string")),
+    })
+    values = budget_df.pivot_table(index=KEYS, columns="Is Actual", values="Érték", aggfunc="sum")
+    values = values.reindex(columns=[False, True]).set_axis(["Budget", "Actual"], axis=1)
+    # The name of the plan line; Actual lines only fill in where there is no plan line
+    names = (budget_df.sort_values("Is Actual").groupby(["Asset", "Cost Code"])["Cost Name"].first())
+    return values.reset_index().join(names, on=["Asset", "Cost Code"])
+
+
+def invoices_by_month(invoice_df):
+    """Net/gross invoice amounts and invoice counts per Asset, cost code and month, by due and by payment date."""
+    invoice_df = invoice_df.assign(**{
+        "Cost Code": budget_line_code(invoice_df["Budget Line"]),
+        # NUMERIC columns come back as Decimal on PostgreSQL
+        "Invoice Net Amount (Euro)": pd.to_numeric(invoice_df["Invoice Net Amount (Euro)"]).astype("float64"),
+        "Invoice Gross Amount (Euro)": pd.to_numeric(invoice_df["Invoice Gross Amount (Euro)"]).astype("float64"),
+    })
+    frames = []
+    for basis, date_column in DATE_BASES.items():
+        dated = invoice_df.dropna(subset=[date_column])
+        dated = dated.assign(Month=pd.to_datetime(dated[date_column]).dt.to_period("M").dt.to_timestamp())
+        frames.append(dated.groupby(KEYS, dropna=False).agg(**{
+            f"Invoice Net ({basis})": ("Invoice Net Amount (Euro)", "sum"),
+            f"Invoice Gross ({basis})": ("Invoice Gross Amount (Euro)", "sum"),
+            f"Invoices ({basis})": ("Invoice Net Amount (Euro)", "size"),
+        }))
+    return pd.concat(frames, axis=1).reset_index()
+
+
+def build_reconciliation(budget_df, invoice_df):
+    """One row per Asset, cost code and month that has a budget, an actual or an invoice."""
+    budget = budget_by_month(budget_df)
+    invoices = invoices_by_month(invoice_df)
+    df = budget.merge(invoices, on=KEYS, how="outer")
+    for basis in DATE_BASES:
+        df[f"Invoices ({basis})"] = df[f"Invoices ({basis})"].fillna(0).astype("int64")
+    df["Month"] = df["Month"].dt.date
+    return df[list(RECONCILIATION_COLUMN_TYPES)].sort_values(KEYS, ignore_index=True)
+
+
+def refresh_reconciliation(conn, assets=None):
+    """Rebuild the reconciliation rows of the given assets (every asset if None) from the loaded tables.
+
+    Run it inside ``engine.begin()`` after the budget and invoice loads have
+    committed; other assets' rows are left alone. Returns the number of rows
+    written.
+    """
+    if assets is not None:
+        assets = sorted({a for a in assets if pd.notna(a)})
+        if not assets:
+            return 0
+        if not inspect(conn).has_table(RECONCILIATION_TABLE):
+            assets = None  # first build: every asset
+
+    budget_df = _read(conn, BUDGET_TABLE, ["Cost Code", "Cost Name", "Asset", "Hónap", "Érték"], assets)
+    invoice_df = _read(conn, INVOICE_TABLE, ["Budget Line", "Due Date", "Invoice Payment Date", "Asset",
+                                             "Invoice Net Amount (Euro)", "Invoice Gross Amount (Euro)"], assets)
+    df = build_reconciliation(budget_df, invoice_df)
+
+    load = StagedLoad(conn, RECONCILIATION_TABLE, dtype=RECONCILIATION_COLUMN_TYPES, assets=assets,
+                      indexes=RECONCILIATION_INDEXES)
+    load.append(df)
+    return load.finish()
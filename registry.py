@@ -0,0 +1,229 @@
+"""Workbook registry: finds the budget workbooks in a folder and sniffs each one's layout.
+
+Only the sheet names and the first rows of the budget and invoice sheets are
+read. The detected layout (year, sheets, asset cell, first cost line, invoice
+header row and columns) is cached per workbook content hash, so an unchanged
+workbook is never sniffed twice and onboarding a new asset needs no code change.
+"""
+import json
+import os
+import re
+
+from openpyxl.utils import get_column_letter
+
+from extractor_class import BUDGET_START_ROW, INVOICE_REQUIRED_COLUMNS
+from manifest import normalize_path
+from workbook_cache import workbook_cache
+
+# Bump whenever the sniffing logic changes, so cached layouts from older versions are not reused
+LAYOUT_VERSION = 2
+
+# Set ITAM_LAYOUT_CACHE_DIR to an empty string to keep layouts in memory only
+LAYOUT_CACHE_DIR = os.environ.get("ITAM_LAYOUT_CACHE_DIR",
+                                  os.path.join(os.path.expanduser("~"), ".cache", "itam_layouts"))
+
+BUDGET_SHEET = re.compile(r"(\d{4}) Budget vs Actual")
+INVOICE_SHEET = re.compile(r"(\d{4}) Invoice Approvals")
+
+# Rows of the budget sheet searched for the asset cell and the first cost line
+BUDGET_SNIFF_ROWS = 60
+# Rows of the invoice sheet searched for the header row
+INVOICE_SNIFF_ROWS = 15
+
+# Where the asset name is when the sheet has no 'Asset' label
+DEFAULT_ASSET_CELL = "D4"
+ASSET_LABELS = {"asset", "asset name", "property"}
+
+# Cost codes like 21000, 30040LC or CW00007
+COST_CODE = re.compile(r"[A-Z]*\d{4,}[A-Z]*")
+# Consecutive cost lines that mark the start of the budget block (a lone number is not enough)
+MIN_COST_LINES = 3
+# Blank rows that may separate earlier cost lines from that run and still belong to the block
+MAX_BLANK_GAP = 2
+
+# Header spellings used by some workbooks, after whitespace is collapsed and case ignored
+INVOICE_COLUMN_ALIASES = {
+    "po number (purchase order)": "Jira Number (Purchase Order)",
+    "vendor": "Vendor (Contractor)",
+}
+
+
+def is_workbook(path):
+    """True for .xlsx files, but not for Office's '~$' lock files."""
+    name = os.path.basename(path)
+    return name.endswith(".xlsx") and not name.startswith("~$")
+
+
+def discover_workbooks(budgets_dir):
+    """Every workbook in the budgets directory (normalized paths, see manifest.py), in file name order."""
+    return [normalize_path(os.path.join(budgets_dir, file_name)) for file_name in sorted(os.listdir(budgets_dir))
+            if is_workbook(file_name)]
+
+
+def _header_key(value):
+    return " ".join(str(value).split()).casefold()
+
+
+# Canonical invoice column for every accepted header spelling
+_INVOICE_HEADERS = {**{_header_key(col): col for col in INVOICE_REQUIRED_COLUMNS},
+                    **{_header_key(alias): col for alias, col in INVOICE_COLUMN_ALIASES.items()}}
+
+
+def _find_sheet(sheet_names, pattern):
+    for sheet_name in sheet_names:
+        match = pattern.fullmatch(sheet_name.strip())
+        if match:
+            return sheet_name, int(match.group(1))
+    return None, None
+
+
+def _is_cost_code(value):
+    if value is None or value != value:  # empty or NaN
+        return False
+    text = str(value).strip()
+    if text.endswith(".0"):
+        text = text[:-2]
+    return COST_CODE.fullmatch(text) is not None
+
+
+def sniff_asset_cell(rows):
+    """A1 reference of the cell right of an 'Asset' label, or DEFAULT_ASSET_CELL."""
+    for row, values in rows.iterrows():
+        values = values.tolist()
+        for col, value in enumerate(values):
+            if isinstance(value, str) and _header_key(value).rstrip(":") in ASSET_LABELS:
+                for value_col in range(col + 1, len(values)):
+                    if values[value_col] is not None and values[value_col] == values[value_col]:
+                        return f"{get_column_letter(value_col + 1)}{row + 1}"
+    return DEFAULT_ASSET_CELL
+
+
+def sniff_data_start_row(rows):
+    """1-based row of the first cost line.
+
+    The standard row (BUDGET_START_ROW) is kept whenever it has a cost code in
+    A, as in the fixed layout. Otherwise the block starts at the first
+    MIN_COST_LINES rows in a row with a cost code in A and a name in C, moved
+    up over earlier such rows separated from it by at most MAX_BLANK_GAP blank
+    rows.
+    """
+    has_code = [_is_cost_code(values[0]) for values in rows.itertuples(index=False)]
+    start = BUDGET_START_ROW - 1 - int(rows.index[0]) if len(rows) else -1
+    if 0 <= start < len(rows) and has_code[start]:
+        return BUDGET_START_ROW
+
+    is_line = [code and len(values) > 2 and values[2] is not None and values[2] == values[2]
+               for code, values in zip(has_code, rows.itertuples(index=False))]
+    is_blank = rows.isna().all(axis=1).tolist()
+    for i in range(len(is_line) - MIN_COST_LINES + 1):
+        if all(is_line[i:i + MIN_COST_LINES]):
+            first = i
+            for j in range(i - 1, -1, -1):
+                if is_line[j]:
+                    first = j
+                elif not is_blank[j] or first - j > MAX_BLANK_GAP:
+                    break
+            return int(rows.index[first]) + 1
+    return BUDGET_START_ROW
+
+
+def sniff_invoice_header(rows):
+    """(1-based header row, {column: 1-based column index}) of the row naming the most invoice columns."""
+    best_row, best_columns = None, {}
+    for row, values in rows.iterrows():
+        columns = {}
+        for col, value in enumerate(values.tolist()):
+            if value is None or value != value:
+                continue
+            canonical = _INVOICE_HEADERS.get(_header_key(value))
+            if canonical is not None and canonical not in columns:
+                columns[canonical] = col + 1
+        if len(columns) > len(best_columns):
+            best_row, best_columns = int(row) + 1, columns
+            if len(columns) == len(INVOICE_REQUIRED_COLUMNS):
+                break
+    return best_row, best_columns
+
+
+def sniff_layout(file_path, cache=workbook_cache):
+    """Detect a workbook's layout from its sheet names and first rows."""
+    sheet_names = cache.sheet_names(file_path)
+    budget_tab, year = _find_sheet(sheet_names, BUDGET_SHEET)
+    if budget_tab is None:
+        raise ValueError(f"No '<year> Budget vs Actual' sheet found in {file_path}")
+    layout = {
+        "version": LAYOUT_VERSION,
+        "year": year,
+        "budget_tab": budget_tab,
+        "invoice_tab": None,
+        "invoice_header_row": None,
+        "invoice_columns": {},
+    }
+
+    rows = cache.get_range(file_path, budget_tab, min_row=1, max_row=BUDGET_SNIFF_ROWS, min_col=1, max_col=15)
+    layout["asset_cell"] = sniff_asset_cell(rows)
+    layout["data_start_row"] = sniff_data_start_row(rows)
+
+    # The invoice sheet of the budget year, or of any year if the workbook has only one
+    invoice_tab = next((name for name in sheet_names if name.strip() == f"{year} Invoice Approvals"), None)
+    if invoice_tab is None:
+        invoice_tab, _ = _find_sheet(sheet_names, INVOICE_SHEET)
+    if invoice_tab is not None:
+        header_rows = cache.get_range(file_path, invoice_tab, min_row=1, max_row=INVOICE_SNIFF_ROWS)
+        layout["invoice_tab"] = invoice_tab
+        layout["invoice_header_row"], layout["invoice_columns"] = sniff_invoice_header(header_rows)
+    return layout
+
+
+class LayoutCache:
+    """Detected layouts keyed by workbook content hash, in memory and as small JSON files on disk."""
+
+    def __init__(self, cache_dir=LAYOUT_CACHE_DIR, version=LAYOUT_VERSION):
+        self.cache_dir = cache_dir
+        self.version = version
+        self._layouts = {}
+
+    @property
+    def enabled(self):
+        return bool(self.cache_dir)
+
+    def _path(self, content_hash):
+        return os.path.join(self.cache_dir, f"{content_hash}.v{self.version}.json")
+
+    def get(self, content_hash):
+        if content_hash is None:
+            return None
+        layout = self._layouts.get(content_hash)
+        if layout is None and self.enabled and os.path.exists(self._path(content_hash)):
+            try:
+                with open(self._path(content_hash), encoding="utf-8") as f:
+                    layout = self._layouts[content_hash] = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable layout cache entry {self._path(content_hash)}: {e}")
+        return layout
+
+    def put(self, content_hash, layout):
+        if content_hash is None:
+            return
+        self._layouts[content_hash] = layout
+        if not self.enabled:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(content_hash)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(layout, f)
+        os.replace(tmp_path, path)  # atomic, so parallel workers never see a partial file
+
+
+# Shared by ingestion and the processors
+layout_cache = LayoutCache()
+
+
+def workbook_layout(file_path, content_hash=None, cache=workbook_cache):
+    """The workbook's layout, from the layout cache when its content hash was sniffed before."""
+    layout = layout_cache.get(content_hash)
+    if layout is None:
+        layout = sniff_layout(file_path, cache)
+        layout_cache.put(content_hash, layout)
+    return layout
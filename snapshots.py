@@ -0,0 +1,231 @@
+"""Append-only budget history: every snapshot stores only the budget values that changed since the previous one.
+
+Each (Asset, Cost Code, month) value is hashed together with its cost name; a
+snapshot appends the rows whose hash changed, plus a tombstone for every value
+that disappeared, to budget_snapshot_deltas under a new version recorded in
+budget_snapshot_versions. ``budget_as_of(version)`` rebuilds the budget as it
+was at any version and budget_snapshot_latest shows the newest state.
+
+Snapshots are taken after the budget load with ``python pipeline.py --snapshot``
+(or ITAM_BUDGET_SNAPSHOTS=1). Old history is folded away with
+
+    python snapshots.py --compact-before VERSION [--db-url URL]
+"""
+import argparse
+import datetime
+
+import pandas as pd
+import sqlalchemy.types as types
+from sqlalchemy import bindparam, inspect, text
+
+from budget_storage import BUDGET_TABLE
+from loader import append_frame, get_engine
+from pipeline import DB_URL
+
+VERSIONS_TABLE = "budget_snapshot_versions"
+DELTAS_TABLE = "budget_snapshot_deltas"
+LATEST_VIEW = "budget_snapshot_latest"
+
+KEYS = ["Asset", "Cost Code", "Hónap"]
+
+DELTA_COLUMN_TYPES = {
+    "Version": types.INTEGER,
+    "Asset": types.VARCHAR(255),
+    "Cost Code": types.VARCHAR(50),
+    "Hónap": types.DATE,
+    "Cost Name": types.VARCHAR(255),
+    "Érték": types.FLOAT,
+    "Value Hash": types.BIGINT,
+    "Deleted": types.BOOLEAN,
+}
+
+_TABLES_SQL = {
+    VERSIONS_TABLE: """
+        "Version" INTEGER PRIMARY KEY,
+        "Created At" TIMESTAMP NOT NULL,
+        "Assets" VARCHAR(2000),
+        "Changed Rows" INTEGER NOT NULL
+    """,
+    DELTAS_TABLE: """
+        "Version" INTEGER NOT NULL,
+        "Asset" VARCHAR(255),
+        "Cost Code" VARCHAR(50),
+        "Hónap" DATE,
+        "Cost Name" VARCHAR(255),
+        "Érték" FLOAT,
+        "Value Hash" BIGINT,
+        "Deleted" BOOLEAN NOT NULL
+    """,
+}
+
+_KEY_SQL = '"Asset", "Cost Code", "Hónap"'
+
+
+def _latest_sql(version_filter="", asset_filter=""):
+    """The newest delta of every key (up to a version), tombstones dropped."""
+    return f"""
+        SELECT "Version", "Asset", "Cost Code", "Hónap", "Cost Name", "Érték", "Value Hash" FROM (
+            SELECT d.*, ROW_NUMBER() OVER (PARTITION BY {_KEY_SQL} ORDER BY "Version" DESC) AS rn
+            FROM {DELTAS_TABLE} d
+            WHERE 1 = 1{version_filter}{asset_filter}
+        ) latest
+        WHERE rn = 1 AND NOT "Deleted"
+    """
+
+
+def ensure_snapshot_tables(conn):
+    """Create the version and delta tables, the (key, version) index and the latest-state view."""
+    for table, columns in _TABLES_SQL.items():
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table} ({columns})"))
+    # Serves the as-of lookups: the newest version of a key is the last index entry of that key
+    conn.execute(text(
+        f'CREATE INDEX IF NOT EXISTS {DELTAS_TABLE}_key_idx ON {DELTAS_TABLE} ({_KEY_SQL}, "Version")'
+    ))
+    create = "CREATE OR REPLACE VIEW" if conn.dialect.name == "postgresql" else "CREATE VIEW IF NOT EXISTS"
+    conn.execute(text(f"{create} {LATEST_VIEW} AS {_latest_sql()}"))
+
+
+def value_hashes(df):
+    """64-bit hash of each row's cost name and value, as signed integers for a BIGINT column."""
+    return pd.util.hash_pandas_object(df[["Cost Name", "Érték"]], index=False).to_numpy().view("int64")
+
+
+def _normalize(df):
+    """One row per key with the month as a datetime; duplicate lines of a key are summed (all blank stays NULL)."""
+    df = df.assign(**{"Hónap": pd.to_datetime(df["Hónap"]).dt.normalize(),
+                      "Cost Code": df["Cost Code"].astype(str), "Cost Name": df["Cost Name"].astype(str)})
+    grouped = df.groupby(KEYS, sort=False)
+    return pd.concat([grouped["Cost Name"].first(), grouped["Érték"].sum(min_count=1)], axis=1).reset_index()
+
+
+def _read(conn, sql, assets, params=None):
+    query = text(sql)
+    params = dict(params or {})
+    if assets is not None:
+        query = query.bindparams(bindparam("assets", expanding=True))
+        params["assets"] = assets
+    return pd.read_sql(query, conn, params=params)
+
+
+def newest_version(conn):
+    """The newest version in the version or the delta table (0 if none), so a number is never handed out twice."""
+    return conn.execute(text(
+        f'SELECT MAX(v) FROM (SELECT MAX("Version") AS v FROM {VERSIONS_TABLE} '
+        f'UNION ALL SELECT MAX("Version") FROM {DELTAS_TABLE}) versions'
+    )).scalar() or 0
+
+
+def take_snapshot(conn, assets=None):
+    """Append the changed budget values of the given assets (all if None) as a new version.
+
+    Run it inside ``engine.begin()`` after the budget load. Returns (version,
+    rows appended); a version is recorded even when nothing changed.
+    """
+    ensure_snapshot_tables(conn)
+    if assets is not None:
+        assets = sorted({a for a in assets if pd.notna(a)})
+        if not assets:
+            return None, 0
+    asset_filter = ' AND "Asset" IN :assets' if assets is not None else ""
+
+    if conn.dialect.name == "postgresql":
+        # Versions are numbered in commit order
+        conn.execute(text(f"LOCK TABLE {VERSIONS_TABLE} IN EXCLUSIVE MODE"))
+    version = newest_version(conn) + 1
+
+    current = _normalize(_read(
+        conn, f'SELECT {_KEY_SQL}, "Cost Name", "Érték" FROM {BUDGET_TABLE} WHERE 1 = 1{asset_filter}', assets
+    ))
+    # Nullable integers, so the outer merge does not turn the 64-bit hashes into lossy floats
+    current["Value Hash"] = pd.array(value_hashes(current), dtype="Int64")
+    previous = _read(conn, _latest_sql(asset_filter=asset_filter), assets)
+    previous = previous.assign(**{"Hónap": pd.to_datetime(previous["Hónap"]).dt.normalize(),
+                                  "Value Hash": previous["Value Hash"].astype("Int64")})[KEYS + ["Value Hash"]]
+
+    merged = current.merge(previous, on=KEYS, how="outer", suffixes=("", " Before"), indicator=True)
+    is_changed = (merged["Value Hash"] != merged["Value Hash Before"]).fillna(False).astype(bool)
+    changed = merged[(merged["_merge"] == "left_only") | ((merged["_merge"] == "both") & is_changed)]
+    removed = merged[merged["_merge"] == "right_only"]
+    deltas = pd.concat([
+        changed.assign(Deleted=False),
+        removed.assign(**{"Cost Name": None, "Érték": None, "Value Hash": None, "Deleted": True}),
+    ], ignore_index=True)
+    deltas["Version"] = version
+    deltas["Hónap"] = deltas["Hónap"].dt.date
+    deltas = deltas[list(DELTA_COLUMN_TYPES)]
+
+    conn.execute(
+        text(f'INSERT INTO {VERSIONS_TABLE} ("Version", "Created At", "Assets", "Changed Rows") '
+             f'VALUES (:version, :created_at, :assets, :changed)'),
+        {"version": version, "created_at": datetime.datetime.now(),
+         "assets": None if assets is None else ", ".join(assets)[:2000], "changed": len(deltas)}
+    )
+    append_frame(conn, deltas, DELTAS_TABLE)
+    return version, len(deltas)
+
+
+def budget_as_of(version, assets=None, db_url=DB_URL):
+    """The budget values (Asset, Cost Code, Hónap, Cost Name, Érték) as they were at a snapshot version."""
+    engine = get_engine(db_url)
+    with engine.connect() as conn:
+        oldest = conn.execute(text(f'SELECT MIN("Version") FROM {VERSIONS_TABLE}')).scalar()
+        if oldest is None or version < oldest:
+            raise ValueError(f"Version {version} is not available; the oldest kept version is {oldest}.")
+        asset_filter = ' AND "Asset" IN :assets' if assets is not None else ""
+        df = _read(conn, _latest_sql(' AND "Version" <= :version', asset_filter),
+                   sorted(assets) if assets is not None else None, {"version": int(version)})
+    return df.drop(columns=["Value Hash"]).sort_values(KEYS, ignore_index=True)
+
+
+def compact_snapshots(conn, before_version):
+    """Fold the history before ``before_version`` into that version's state.
+
+    Every key keeps only its newest delta up to ``before_version``, tombstones
+    at or before it are dropped and older version rows are removed, so as-of
+    queries stay exact from ``before_version`` on. Run it inside
+    ``engine.begin()``. Returns the number of delta rows removed. Raises
+    ValueError for a version newer than the newest snapshot, which would fold
+    away every version.
+    """
+    newest = newest_version(conn)
+    if before_version > newest:
+        raise ValueError(f"Cannot compact before version {before_version}; the newest version is {newest}.")
+    params = {"version": int(before_version)}
+    superseded = conn.execute(text(f"""
+        DELETE FROM {DELTAS_TABLE}
+        WHERE "Version" <= :version AND EXISTS (
+            SELECT 1 FROM {DELTAS_TABLE} newer
+            WHERE newer."Asset" = {DELTAS_TABLE}."Asset" AND newer."Cost Code" = {DELTAS_TABLE}."Cost Code"
+              AND newer."Hónap" = {DELTAS_TABLE}."Hónap"
+              AND newer."Version" > {DELTAS_TABLE}."Version" AND newer."Version" <= :version
+        )
+    """), params).rowcount
+    tombstones = conn.execute(
+        text(f'DELETE FROM {DELTAS_TABLE} WHERE "Version" <= :version AND "Deleted"'), params
+    ).rowcount
+    conn.execute(text(f'DELETE FROM {VERSIONS_TABLE} WHERE "Version" < :version'), params)
+    return superseded + tombstones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact the budget snapshot history.")
+    parser.add_argument("--compact-before", type=int, required=True,
+                        help="Keep exact history from this version on; older versions are folded into it")
+    parser.add_argument("--db-url", default=DB_URL, help="SQLAlchemy URL of the target database")
+    args = parser.parse_args(argv)
+
+    engine = get_engine(args.db_url)
+    with engine.begin() as conn:
+        if not inspect(conn).has_table(DELTAS_TABLE):
+            print("No budget snapshots yet. Nothing to compact.")
+            return
+        try:
+            removed = compact_snapshots(conn, args.compact_before)
+        except ValueError as e:
+            print(e)
+            return
+    print(f"Removed {removed} superseded snapshot row(s) before version {args.compact_before}.")
+
+
+if __name__ == "__main__":
+    main()
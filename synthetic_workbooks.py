@@ -0,0 +1,128 @@
+"""Synthetic budget workbooks in the layouts the extractors expect, for local benchmarks and checks.
+
+Usage: python synthetic_workbooks.py OUT_DIR [--files 17] [--cost-lines 300] [--invoice-rows 200]
+"""
+import argparse
+import datetime
+import os
+import random
+
+from openpyxl import Workbook
+
+from extractor_class import BUDGET_TAB, INVOICE_TAB
+from hierarchy import PARENT_CHILD_HIERARCHY
+
+# Asset file names of the real workbooks, so the generated folder can stand in for the real one
+ASSET_NAMES = [
+    "EdithFund", "OneVictorei", "AI", "Xantium", "PromenadaMall", "Remsing", "Taifun", "HotelOscar",
+    "PortaSiena", "Vilamarina", "Bonaire", "Baneas", "DounbyC", "DounbyD", "DounbyE", "DounbyF",
+    "LeMasserie", "EspacioLeon",
+]
+
+INVOICE_HEADERS = [
+    "Jira Number (Purchase Order)", "Vendor (Contractor)", "Description", "Budget Line", "Due Date",
+    "Invoice Net Amount (Euro)", "Invoice Gross Amount (Euro)", "Country Office Approval (Date)",
+    "HQ Approval (Date)", "Invoice Payment Date",
+]
+
+# EspacioLeon's workbook uses different names for the first two invoice columns
+ESPACIO_LEON_HEADERS = {
+    "Jira Number (Purchase Order)": "PO Number       (Purchase Order)",
+    "Vendor (Contractor)": "Vendor",
+}
+
+
+def _file_name(asset, year):
+    return f"EdithFund{year}.xlsx" if asset == "EdithFund" else f"{asset}Budget{year}.xlsx"
+
+
+def _cost_codes(count, rng):
+    """Hierarchy codes first (so rollups have something to aggregate), then made-up leaf codes."""
+    known = list(PARENT_CHILD_HIERARCHY)
+    known += [child for children in PARENT_CHILD_HIERARCHY.values() for child in children]
+    codes = list(dict.fromkeys(known))[:count]
+    while len(codes) < count:
+        codes.append(str(40000 + len(codes)))
+    rng.shuffle(codes)
+    return codes
+
+
+def _amount(rng, comma_decimals):
+    value = round(rng.uniform(0, 50000), 2)
+    # Some controllers type amounts as text with a decimal comma
+    return f"{value:.2f}".replace(".", ",") if rng.random() < comma_decimals else value
+
+
+def write_budget_workbook(path, asset, year=2024, cost_lines=300, invoice_rows=200, invoice_header_row=4,
+                          espacio_leon_headers=False, comma_decimals=0.05, seed=None):
+    """Write one workbook with a budget sheet and an invoice approvals sheet.
+
+    Budget sheet: asset name in D4, cost lines from row 22 with the code in A,
+    a fallback name in B, the name in C and twelve months in D:O. Every cost
+    line is followed by its 'Actual' line. Invoice sheet: headers on
+    ``invoice_header_row`` and ``invoice_rows`` rows below it.
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+
+    budget = wb.create_sheet(BUDGET_TAB.format(year=year))
+    for row in range(1, 22):
+        budget.append([None, None, None, asset] if row == 4 else [])
+    for code in _cost_codes(cost_lines, rng):
+        # Numeric codes are stored as numbers, like in the real workbooks
+        cell_code = int(code) if code.isdigit() else code
+        name = f"Cost line {code}"
+        budget.append([cell_code, name, name] + [_amount(rng, comma_decimals) for _ in range(12)])
+        budget.append([cell_code, name, f"{name} Actual"] + [_amount(rng, comma_decimals) for _ in range(12)])
+
+    invoices = wb.create_sheet(INVOICE_TAB.format(year=year))
+    headers = [ESPACIO_LEON_HEADERS.get(h, h) if espacio_leon_headers else h for h in INVOICE_HEADERS]
+    for _ in range(invoice_header_row - 1):
+        invoices.append([])
+    invoices.append(headers)
+    for i in range(invoice_rows):
+        due = datetime.datetime(year, rng.randint(1, 12), rng.randint(1, 28))
+        net = round(rng.uniform(100, 20000), 2)
+        invoices.append([
+            f"JIRA-{i}", f"Vendor {rng.randint(1, 40)}", f"Invoice {i}", f"{rng.choice(list(PARENT_CHILD_HIERARCHY))}",
+            due, net, round(net * 1.27, 2), due - datetime.timedelta(days=10), due - datetime.timedelta(days=5),
+            due + datetime.timedelta(days=rng.randint(0, 30)),
+        ])
+
+    wb.save(path)
+    return path
+
+
+def generate_workbooks(out_dir, files=len(ASSET_NAMES), year=2024, cost_lines=300, invoice_rows=200,
+                       comma_decimals=0.05, seed=0):
+    """Write ``files`` workbooks named like the real ones and return their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(files):
+        asset = ASSET_NAMES[i % len(ASSET_NAMES)]
+        if i >= len(ASSET_NAMES):
+            asset = f"{asset}{i // len(ASSET_NAMES)}"
+        path = os.path.join(out_dir, _file_name(asset, year))
+        write_budget_workbook(
+            path, asset, year=year, cost_lines=cost_lines, invoice_rows=invoice_rows,
+            invoice_header_row=5 if asset.startswith("OneVictorei") else 4,
+            espacio_leon_headers=asset.startswith("EspacioLeon"),
+            comma_decimals=comma_decimals, seed=seed + i,
+        )
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic budget workbooks.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=len(ASSET_NAMES))
+    parser.add_argument("--year", type=int, default=2024)
+    parser.add_argument("--cost-lines", type=int, default=300)
+    parser.add_argument("--invoice-rows", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    written = generate_workbooks(args.out_dir, files=args.files, year=args.year, cost_lines=args.cost_lines,
+                                 invoice_rows=args.invoice_rows, seed=args.seed)
+    print(f"Wrote {len(written)} workbooks to {args.out_dir}")
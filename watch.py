@@ -0,0 +1,146 @@
+"""Watch the budgets folder and reload a workbook's asset within seconds of it being saved.
+
+Uses file system events (inotify on Linux, via the optional ``watchdog``
+package) and falls back to polling the folder when watchdog is not installed.
+Run it with ``python pipeline.py --watch``.
+"""
+import os
+import threading
+import time
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional; without it the folder is polled
+    FileSystemEventHandler = object
+    Observer = None
+
+from registry import is_workbook
+
+# A workbook is reloaded once it has had no events for this long and its size/mtime stopped changing
+WATCH_DEBOUNCE_SECONDS = float(os.environ.get("ITAM_WATCH_DEBOUNCE", 2))
+# Folder scan interval when polling
+WATCH_POLL_SECONDS = float(os.environ.get("ITAM_WATCH_POLL", 2))
+
+
+def _stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def folder_stats(budgets_dir):
+    """{path: (size, mtime)} of every workbook in the folder."""
+    stats = {}
+    for entry in os.scandir(budgets_dir):
+        if entry.is_file() and is_workbook(entry.path):
+            stat = entry.stat()
+            stats[entry.path] = (stat.st_size, stat.st_mtime)
+    return stats
+
+
+class ChangeDebouncer:
+    """Collects change notifications and releases a workbook only once it is quiet and stable.
+
+    Excel and OneDrive write a workbook in several steps (temp file, rename,
+    sync), so a path becomes ready after ``delay`` seconds without events and
+    with the same size and mtime on two consecutive checks.
+    """
+
+    def __init__(self, delay=WATCH_DEBOUNCE_SECONDS):
+        self.delay = delay
+        self.pending = {}  # path -> (time of the last event or check, (size, mtime) seen then)
+        self.lock = threading.Lock()
+
+    def touch(self, path):
+        with self.lock:
+            self.pending[path] = (time.monotonic(), None)
+
+    def ready(self):
+        """Return the paths that are ready to be reloaded and forget them."""
+        now, ready = time.monotonic(), []
+        with self.lock:
+            for path, (seen, stat) in list(self.pending.items()):
+                if now - seen < self.delay:
+                    continue
+                try:
+                    current = _stat(path)
+                except FileNotFoundError:  # deleted or renamed away meanwhile
+                    del self.pending[path]
+                    continue
+                if current != stat:
+                    self.pending[path] = (now, current)
+                    continue
+                del self.pending[path]
+                ready.append(path)
+        return ready
+
+
+# watchdog event types that mean a file was written ("closed" is a close after writing)
+WRITE_EVENTS = {"created", "modified", "moved", "closed"}
+
+
+class _WorkbookEventHandler(FileSystemEventHandler):
+    def __init__(self, debouncer):
+        super().__init__()
+        self.debouncer = debouncer
+
+    def on_any_event(self, event):
+        # Only writes count; reading the workbooks during a reload also raises open/close events
+        if event.is_directory or event.event_type not in WRITE_EVENTS:
+            return
+        # Excel saves through a temp file that is renamed over the workbook
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if path and is_workbook(path):
+                self.debouncer.touch(path)
+
+
+def watch(budgets_dir, db_url, stages=("budget", "invoices"), workers=1, use_events=True, snapshot=False):
+    """Reload each saved workbook's asset until interrupted (Ctrl+C).
+
+    Runs in-process with one worker by default, so the imports and the pooled
+    engine stay warm between reloads. The workbook cache is emptied after every
+    reload, so no workbook stays open while the user edits it.
+    """
+    import main
+    from instrumentation import recorder
+    from workbook_cache import workbook_cache
+
+    debouncer = ChangeDebouncer()
+    observer = None
+    if use_events and Observer is not None:
+        observer = Observer()
+        observer.schedule(_WorkbookEventHandler(debouncer), budgets_dir, recursive=False)
+        observer.start()
+    previous = folder_stats(budgets_dir) if observer is None else None
+    print(f"Watching {os.path.abspath(budgets_dir)} ({'file system events' if observer else 'polling'}). Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            time.sleep(0.5 if observer else WATCH_POLL_SECONDS)
+            if observer is None:
+                current = folder_stats(budgets_dir)
+                for path, stat in current.items():
+                    if previous.get(path) != stat:
+                        debouncer.touch(path)
+                previous = current
+
+            for path in debouncer.ready():
+                file_name = os.path.basename(path)
+                started = time.perf_counter()
+                try:
+                    loaded = main.run(budgets_dir, db_url, stages=stages, files=[file_name], workers=workers,
+                                      snapshot=snapshot)
+                    print(f"Reloaded {file_name} in {time.perf_counter() - started:.1f} s: {loaded}")
+                except Exception as e:
+                    print(f"Error reloading {file_name}: {e}")
+                finally:
+                    # Open read-only workbooks hold file handles, which keep Excel/OneDrive from saving over them
+                    workbook_cache.clear()
+                # A long-running watch keeps no stage records; each reload is reported on its own line
+                recorder.records.clear()
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
@@ -0,0 +1,69 @@
+import os
+from collections import OrderedDict
+
+from excel_readers import get_reader, parse_cell_ref
+
+
+class WorkbookCache:
+    """LRU cache of open workbooks and the ranges read from them, keyed by file path and mtime.
+
+    Every processor reads through the shared ``workbook_cache`` instance, so a
+    range is read at most once per run no matter how many processors touch the
+    same workbook. A workbook saved again on disk gets a new mtime and is
+    re-read on the next access.
+    """
+
+    def __init__(self, max_workbooks=32, reader=None):
+        self.max_workbooks = max_workbooks
+        self.reader = reader if reader is not None else get_reader()
+        self._workbooks = OrderedDict()
+
+    def get_range(self, file_path, tab_name, min_row=1, max_row=None, min_col=1, max_col=None):
+        """Return a 1-based, inclusive cell range as a header-less DataFrame.
+
+        The frame is shared with later callers, so copy it before modifying it.
+        """
+        entry = self._get_entry(file_path)
+        key = (tab_name, min_row, max_row, min_col, max_col)
+        ranges = entry["ranges"]
+        if key not in ranges:
+            ranges[key] = self.reader.read_range(entry["workbook"], tab_name, min_row, max_row, min_col, max_col)
+        return ranges[key]
+
+    def get_cell(self, file_path, tab_name, cell_ref):
+        """Return the value of a single A1-style cell."""
+        row, col = parse_cell_ref(cell_ref)
+        cell = self.get_range(file_path, tab_name, row, row, col, col)
+        return cell.iat[0, 0] if not cell.empty else None
+
+    def sheet_names(self, file_path):
+        return self.reader.sheet_names(self._get_entry(file_path)["workbook"])
+
+    def clear(self):
+        for entry in self._workbooks.values():
+            self.reader.close(entry["workbook"])
+        self._workbooks.clear()
+
+    def _get_entry(self, file_path):
+        path = os.path.abspath(file_path)
+        key = (path, os.path.getmtime(path))
+
+        entry = self._workbooks.get(key)
+        if entry is not None:
+            self._workbooks.move_to_end(key)
+            return entry
+
+        # Drop any older version of the same workbook before loading the new one
+        for stale_key in [k for k in self._workbooks if k[0] == path]:
+            self.reader.close(self._workbooks.pop(stale_key)["workbook"])
+
+        entry = {"workbook": self.reader.open(path), "ranges": {}}
+        self._workbooks[key] = entry
+        while len(self._workbooks) > self.max_workbooks:
+            _, evicted = self._workbooks.popitem(last=False)
+            self.reader.close(evicted["workbook"])
+        return entry
+
+
+# Shared by all processor classes
+workbook_cache = WorkbookCache()